@@ -5,49 +5,60 @@ import pandas as pd
 from tqdm import tqdm
 from datagen import *
 from voronoi_knn import *
+from gamestore import load_dataset
+from profiling import profiler
+from gamelog import GameLogWriter
 
-def model_vs_random(model, data1, data2, size=100, num_turns=5, quarantine_distance=5):
-    """Simulate a game and return the final grid and outcome."""
+def model_vs_random(model, data1, data2, size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False, model2=None):
+    """Simulate a game and return the final grid and outcome.
+
+    Red plays model on data1 and moves first; blue plays model2 on data2,
+    or the same model if model2 is None.
+    """
+    model2 = model if model2 is None else model2
     grid = initialize_grid(size)
+    ownership = VoronoiOwnership(size)
     markers = []
-    red_markers = []
-    blue_markers = []
     player = 1
 
     for _ in range(num_turns * 2):
         
         if player == 1:
-            action = model(current_state=markers, data=data1)
+            with profiler.phase("model"):
+                action = model(current_state=markers, data=data1)
             x, y = divmod(action, size)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+            with profiler.phase("validity"):
+                valid = is_valid_move(grid, x, y)
+            if not valid:
+                profiler.count("model_fallbacks")
+                with profiler.phase("sampling"):
+                    x, y = sample_legal_move(grid, rejection_sampling)
             
-            place_marker(grid, x, y, player)
+            place_marker(grid, x, y, player, quarantine_distance)
+            with profiler.phase("scoring"):
+                ownership.place(x, y, player)
             markers.append(size*x+y)
-            red_markers.append((x,y))
         
         else:
-            action = model(current_state=markers, data=data2)
+            with profiler.phase("model"):
+                action = model2(current_state=markers, data=data2)
             x, y = divmod(action, size)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+            with profiler.phase("validity"):
+                valid = is_valid_move(grid, x, y)
+            if not valid:
+                profiler.count("model_fallbacks")
+                with profiler.phase("sampling"):
+                    x, y = sample_legal_move(grid, rejection_sampling)
             
-            place_marker(grid, x, y, player)
+            place_marker(grid, x, y, player, quarantine_distance)
+            with profiler.phase("scoring"):
+                ownership.place(x, y, player)
             markers.append(size*x+y)
-            blue_markers.append((x,y))
 
         player = 2 if player == 1 else 1  # Switch player
 
-    red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
-    red_percentage, blue_percentage = calculate_area_percentage(red_points, blue_points)
+    with profiler.phase("scoring"):
+        red_percentage, blue_percentage = ownership.area_percentage()
 
     if red_percentage > blue_percentage:
         outcome = "red wins"  # Red player wins
@@ -58,32 +69,59 @@ def model_vs_random(model, data1, data2, size=100, num_turns=5, quarantine_dista
 
     return outcome, markers + [red_percentage, blue_percentage]
 
-def simulate_ai_vs_ai(model, data1, data2, name_to_save, num_games=10000, size=100, num_turns=5, quarantine_distance=5):
-    model1 = 0
-    model2 = 0
+def simulate_ai_vs_ai(model, data1, data2, name_to_save, num_games=10000, size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False, chunk_size=500, resume=False, stats_path=None):
+    """Play num_games games, streaming rows to name_to_save every chunk_size games.
+
+    With resume=True a run interrupted part way through continues from its
+    last checkpointed chunk instead of starting over. With stats_path set
+    the run is profiled and its phase timings appended there as a JSON line.
+    """
+    if stats_path is not None:
+        profiler.enable()
     columns = ['Move_{}_P{}'.format(i + 1, 1 + i % 2) for i in range(2 * num_turns)] + ['Area_P1', 'Area_P2']
-    new_data = []
-    for _ in tqdm(range(num_games), desc="Games Played"):
-        outcome, game_data = model_vs_random(model, data1, data2, size=100, num_turns=5, quarantine_distance=5)
-        new_data.append(game_data)
-        if outcome == "red wins":
-            model1 += 1
-        elif outcome == "blue wins":
-            model2 += 1
-    
+    writer = GameLogWriter(name_to_save, columns, chunk_size, resume)
+    first_game = writer.games
+    for _ in tqdm(range(writer.games, num_games), desc="Games Played", initial=writer.games, total=num_games):
+        outcome, game_data = model_vs_random(model, data1, data2, size=size, num_turns=num_turns, quarantine_distance=quarantine_distance, rejection_sampling=rejection_sampling)
+        with profiler.phase("io"):
+            writer.append(game_data, outcome)
+    with profiler.phase("io"):
+        writer.close()
+    if stats_path is not None:
+        profiler.write(stats_path, games=num_games - first_game, driver="ai_vs_ai", name_to_save=name_to_save)
+        profiler.disable()
+
+    model1 = writer.counts.get("red wins", 0)
+    model2 = writer.counts.get("blue wins", 0)
     model1_percentage = (model1/num_games)*100
     model2_percentage = (model2/num_games)*100
     tie_percenrtage = ((num_games-model1-model2)/num_games)*100
-    dataset = pd.DataFrame(new_data, columns=columns)
+    return model1_percentage, model2_percentage, tie_percenrtage
+
+def simulate_ai_vs_ai_lockstep(model_batch, data1, data2, name_to_save, num_games=10000, size=100, num_turns=5, quarantine_distance=5, seed=None):
+    """simulate_ai_vs_ai with every game advanced in lockstep and one model call per ply."""
+    policies = {1: lambda states: model_batch(states, data1), 2: lambda states: model_batch(states, data2)}
+    moves = play_games_lockstep(num_games, size, num_turns, quarantine_distance, np.random.default_rng(seed), policies)
+    red_percentage, blue_percentage = score_moves(moves, size)
+    model1 = int(np.sum(red_percentage > blue_percentage))
+    model2 = int(np.sum(red_percentage < blue_percentage))
+
+    columns = ['Move_{}_P{}'.format(i + 1, 1 + i % 2) for i in range(2 * num_turns)] + ['Area_P1', 'Area_P2']
+    dataset = pd.DataFrame(moves, columns=columns[:-2])
+    dataset['Area_P1'], dataset['Area_P2'] = red_percentage, blue_percentage
     dataset.to_csv(name_to_save, index=False)
+    model1_percentage = (model1/num_games)*100
+    model2_percentage = (model2/num_games)*100
+    tie_percenrtage = ((num_games-model1-model2)/num_games)*100
     return model1_percentage, model2_percentage, tie_percenrtage
 
 if __name__ == "__main__":
     for i in range(30,31):
         print("--------------------")
         print(f"Iteration: {i}")
-        data1, data2 = pd.read_csv("datasets/human1.csv"), pd.read_csv("datasets/human2.csv")
+        data1, data2 = load_dataset("datasets/human1.csv"), load_dataset("datasets/human2.csv")
         name = f"datasets/new_data_{i}.csv"
-        model1_percentage, model2_percentage, tie_percenrtage = simulate_ai_vs_ai(model=model, data1=data1, data2=data2, name_to_save=name, num_games=10000)
+        model1_percentage, model2_percentage, tie_percenrtage = simulate_ai_vs_ai(model=model, data1=data1, data2=data2, name_to_save=name, num_games=10000, resume=True, stats_path="datasets/stats.jsonl")
         print(f"Win Percentage based on area controlled: {model1_percentage}% : {model2_percentage}% : {tie_percenrtage}%")
-        data1, data2 = pd.read_csv(name), pd.read_csv(name)
+        print(f"Prefix table: {get_model(data1).prefix_stats()} : {get_model(data2).prefix_stats()}")
+        data1 = data2 = load_dataset(name)
@@ -0,0 +1,46 @@
+import threading
+import time
+from concurrent.futures import Future
+
+class MoveRequest:
+    """An AI move computed on a background thread.
+
+    The model is called on a daemon thread so the event loop keeps running
+    while it thinks (or refits a neighbour index). Poll done() once per
+    frame; result() then gives the cell id, or None if the model failed or
+    did not answer within timeout seconds, in which case the caller plays a
+    cheap move instead. A cancelled or timed-out request is simply abandoned:
+    its thread finishes in the background and its answer is ignored.
+    """
+    def __init__(self, model, current_state, data, red_points=None, timeout=None):
+        self.future = Future()
+        self.started = time.perf_counter()
+        self.deadline = None if timeout is None else self.started + timeout
+        self.cancelled = False
+        self.thread = threading.Thread(target=self.run, args=(model, list(current_state), data, red_points), daemon=True)
+        self.thread.start()
+
+    def run(self, model, current_state, data, red_points):
+        try:
+            self.future.set_result(model(current_state=current_state, data=data, red_points=red_points))
+        except Exception as error:
+            self.future.set_exception(error)
+
+    def timed_out(self):
+        return self.deadline is not None and time.perf_counter() >= self.deadline and not self.future.done()
+
+    def done(self):
+        """True once there is an answer, an error, a timeout or a cancel."""
+        return self.cancelled or self.future.done() or self.timed_out()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def result(self):
+        """The model's cell id, or None if it timed out, failed or was cancelled."""
+        if self.cancelled or not self.future.done() or self.future.exception() is not None:
+            return None
+        return self.future.result()
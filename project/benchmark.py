@@ -0,0 +1,146 @@
+import argparse
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import numpy as np
+import datagen
+from datagen import initialize_grid, is_valid_move, place_marker, sample_legal_move, calculate_voronoi_points, calculate_area_percentage, simulate_game, generate_dataset
+import voronoi_knn
+import knn_iterate
+
+def measure(func, repeat=5, number=1):
+    """Best time per call over repeat runs of number calls each."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def random_position(size, num_markers, quarantine_distance):
+    """A grid with num_markers alternating markers placed at random legal cells."""
+    grid = initialize_grid(size)
+    red_markers, blue_markers = [], []
+    for i in range(num_markers):
+        player = 1 + i % 2
+        x, y = sample_legal_move(grid)
+        place_marker(grid, x, y, player, quarantine_distance)
+        (red_markers if player == 1 else blue_markers).append((x, y))
+    return grid, red_markers, blue_markers
+
+def bench_engine(size, num_turns, quarantine_distance, repeat):
+    """Micro-benchmarks of the move rules and the ownership kernels."""
+    grid, red_markers, blue_markers = random_position(size, 2 * num_turns, quarantine_distance)
+    cells = [(random.randrange(size), random.randrange(size)) for _ in range(1000)]
+    results = {}
+    results["is_valid_move"] = measure(lambda: [is_valid_move(grid, x, y) for x, y in cells], repeat) / len(cells)
+
+    def place():
+        scratch = initialize_grid(size)
+        for x, y in red_markers + blue_markers:
+            place_marker(scratch, x, y, 1, quarantine_distance)
+    results["place_marker"] = measure(place, repeat) / (2 * num_turns)
+    results["sample_legal_move"] = measure(lambda: sample_legal_move(grid), repeat, 100)
+    for backend in ("brute", "edt"):
+        results[f"calculate_voronoi_points[{backend}]"] = measure(lambda: calculate_voronoi_points(grid, red_markers, blue_markers, backend=backend), repeat)
+    red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
+    results["calculate_area_percentage"] = measure(lambda: calculate_area_percentage(red_points, blue_points), repeat, 100)
+    return results
+
+def bench_model(data, size, num_turns, quarantine_distance, repeat, queries=20):
+    """voronoi_knn.model per ply: the first call (index build) and steady-state queries."""
+    results = {}
+    states = datagen.play_random_games(queries, size, num_turns, quarantine_distance, np.random.default_rng(0))
+    for t in range(2 * num_turns):
+        voronoi_knn._models.clear()
+        start = time.perf_counter()
+        voronoi_knn.model(list(states[0, :t]), data)
+        results[f"model_first[ply={t}]"] = time.perf_counter() - start
+        results[f"model[ply={t}]"] = measure(lambda: [voronoi_knn.model(list(state[:t]), data) for state in states], repeat) / queries
+    return results
+
+def bench_games(data, size, num_turns, quarantine_distance, repeat, games=20):
+    """Whole-game throughput, reported as seconds per game."""
+    results = {}
+    results["simulate_game"] = measure(lambda: simulate_game(size, num_turns, quarantine_distance), repeat, games)
+    voronoi_knn.get_model(data)
+    results["model_vs_random"] = measure(lambda: knn_iterate.model_vs_random(voronoi_knn.model, data, size, num_turns, quarantine_distance), repeat, games)
+    return results
+
+def run(sizes, turns, quarantine_distances, dataset_rows, repeat, seed=0, skip_model=False):
+    """Run every benchmark for each parameter combination; keys carry the parameters."""
+    results = {}
+    for size, num_turns, quarantine_distance, rows in itertools.product(sizes, turns, quarantine_distances, dataset_rows):
+        random.seed(seed)
+        np.random.seed(seed)
+        label = f"size={size},turns={num_turns},qd={quarantine_distance},rows={rows}"
+        print(f"Benchmarking {label}", file=sys.stderr)
+        group = bench_engine(size, num_turns, quarantine_distance, repeat)
+        if not skip_model:
+            data = generate_dataset(rows, size, num_turns, quarantine_distance, lockstep=True, seed=seed)
+            group.update(bench_model(data, size, num_turns, quarantine_distance, repeat))
+            group.update(bench_games(data, size, num_turns, quarantine_distance, repeat))
+        for name, seconds in group.items():
+            results[f"{name}[{label}]"] = seconds
+    return results
+
+def compare(baseline, results, threshold):
+    """Print old vs new per benchmark and return the names that got slower than threshold allows."""
+    regressions = []
+    for name in sorted(set(baseline) & set(results)):
+        ratio = results[name] / baseline[name] if baseline[name] > 0 else float('inf')
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{name}: {baseline[name]*1e3:.4f} ms -> {results[name]*1e3:.4f} ms ({ratio:.2f}x){flag}")
+    for name in sorted(set(results) - set(baseline)):
+        print(f"{name}: {results[name]*1e3:.4f} ms (new)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Voronoi game engine and KNN model.")
+    parser.add_argument("--size", type=int, nargs="+", default=[100], help="board sizes")
+    parser.add_argument("--turns", type=int, nargs="+", default=[5], help="turns per player")
+    parser.add_argument("--quarantine", type=float, nargs="+", default=[5], help="quarantine distances")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000], help="generated dataset sizes for the model benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the best is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-model", action="store_true", help="only run the engine micro-benchmarks")
+    parser.add_argument("--save", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", help="compare against a JSON baseline and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before a benchmark counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.size, args.turns, args.quarantine, args.rows, args.repeat, args.seed, args.skip_model)
+    if args.save:
+        baseline = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "args": vars(args),
+            "results": results,
+        }
+        with open(args.save, 'w') as file:
+            json.dump(baseline, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+            return 1
+    elif not args.save:
+        for name, seconds in results.items():
+            print(f"{name}: {seconds*1e3:.4f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
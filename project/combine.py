@@ -1,23 +1,13 @@
 import pandas as pd
+from gamestore import normalize_games, dataframe_to_store
 
-data = pd.read_csv("datasets/voronoi_data.csv")
-data.to_csv("datasets/combined.csv", index=False)
-
-for i in range(1, 11):
-    df = pd.read_csv(f"datasets/knn_data1_{i}.csv")
-    df.to_csv("datasets/combined.csv", mode="a", index=False, header=False)
-
-for i in range(1, 11):
-    df = pd.read_csv(f"datasets/knn_data2_{i}.csv")
-    df.to_csv("datasets/combined.csv", mode="a", index=False, header=False)
-
-df = pd.read_csv("datasets/new_data_30.csv")
-df.to_csv("datasets/combined.csv", mode="a", index=False, header=False)
-
-df = pd.read_csv("datasets/human1.csv")
-df.to_csv("datasets/combined.csv", mode="a", index=False, header=False)
-
-df = pd.read_csv("datasets/human2.csv")
-df.to_csv("datasets/combined.csv", mode="a", index=False, header=False)
+names = ["voronoi_data"]
+names += [f"knn_data1_{i}" for i in range(1, 11)]
+names += [f"knn_data2_{i}" for i in range(1, 11)]
+names += ["new_data_30", "human1", "human2"]
 
+data = pd.concat([normalize_games(pd.read_csv(f"datasets/{name}.csv")) for name in names], ignore_index=True)
+data.to_csv("datasets/combined.csv", index=False)
 
+# Binary copy that game.py and hvsm_dc.py memory-map instead of parsing the CSV
+dataframe_to_store(data, "datasets/combined.vgs")
@@ -1,77 +1,263 @@
 import numpy as np
 import random
-import pandas as pd
-from tqdm import tqdm
+from functools import lru_cache
+from profiling import profiler
 
 def initialize_grid(size):
     """Initialize an empty grid."""
-    grid = np.zeros((size, size, 3), dtype=int)
+    grid = np.zeros((size, size, 3), dtype=np.int8)
     return grid
 
-def is_valid_move(grid, x, y, quarantine_distance, player):
-    """Check if a move is valid based on the quarantine distance."""
+def is_valid_move(grid, x, y):
+    """Check if a move is valid: on the board and outside every quarantine disk.
+
+    Channel 2 of the grid holds the quarantine mask stamped by place_marker
+    with the game's quarantine distance, so the check is a single lookup
+    regardless of how many markers are down.
+    """
     size = grid.shape[0]
     if x < 0 or x >= size or y < 0 or y >= size:
         return False
-    if grid[x, y, 0] != 0 or grid[x, y, 1] != 0 or grid[x, y, 2] != 0:
-        return False
-    for i in range(size):
-        for j in range(size):
-            if grid[i, j, 0] != 0 and ((i - x)**2 + (j - y)**2)**(0.5) <= quarantine_distance:
-                return False
-            if grid[i, j, 1] != 0 and ((i - x)**2 + (j - y)**2)**(0.5) <= quarantine_distance:
-                return False
-    return True
-
-def place_marker(grid, x, y, player):
-    """Place a marker on the grid."""
+    return bool(grid[x, y, 0] == 0 and grid[x, y, 1] == 0 and grid[x, y, 2] == 0)
+
+@lru_cache(maxsize=None)
+def quarantine_disk(quarantine_distance):
+    """Offsets (dx, dy) of every cell within the quarantine distance of a marker."""
+    r = int(np.floor(quarantine_distance))
+    dx, dy = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = (dx**2 + dy**2)**(0.5) <= quarantine_distance
+    return dx[inside], dy[inside]
+
+def place_marker(grid, x, y, player, quarantine_distance):
+    """Place a marker on the grid and stamp its quarantine disk into channel 2."""
+    size = grid.shape[0]
     grid[x, y, player - 1] = 1
+    dx, dy = quarantine_disk(quarantine_distance)
+    qx, qy = x + dx, y + dy
+    on_board = (qx >= 0) & (qx < size) & (qy >= 0) & (qy < size)
+    grid[qx[on_board], qy[on_board], 2] = 1
 
-def calculate_voronoi_points(grid, red_markers, blue_markers):
-    """Calculate the red and blue points based on the Voronoi diagram."""
+def sample_legal_move(grid, rejection_sampling=False):
+    """Draw a move uniformly from the currently legal cells.
+
+    The legal cells are read straight off the quarantine mask, so this takes
+    one draw however full the board is. With rejection_sampling=True the old
+    randint-and-retry loop is used instead, which consumes the random module
+    exactly as before and reproduces seeded runs.
+    """
     size = grid.shape[0]
+    if rejection_sampling:
+        valid_move = False
+        draws = 0
+        while not valid_move:
+            x = random.randint(0, size - 1)
+            y = random.randint(0, size - 1)
+            valid_move = is_valid_move(grid, x, y)
+            draws += 1
+        profiler.count("rejection_retries", draws - 1)
+        return x, y
+    legal = np.flatnonzero(~grid.any(axis=2))
+    if len(legal) == 0:
+        raise ValueError("No legal moves left on the board")
+    return divmod(int(legal[random.randrange(len(legal))]), size)
 
-    if len(blue_markers) == 0 and len(red_markers) == 0:
-        red_markers = np.array(red_markers)
-        empty_points = np.argwhere(np.all(grid == 0, axis=2))
-        red_points = np.zeros((size, size), dtype=bool)
-        blue_points = np.zeros((size, size), dtype=bool)
-        red_points[empty_points[:, 0], empty_points[:, 1]] = False
-        blue_points[empty_points[:, 0], empty_points[:, 1]] = False
-
-    elif len(blue_markers) == 0:
-        red_markers = np.array(red_markers)
-        empty_points = np.argwhere(np.all(grid == 0, axis=2))
-        red_points = np.zeros((size, size), dtype=bool)
-        blue_points = np.zeros((size, size), dtype=bool)
-        red_points[empty_points[:, 0], empty_points[:, 1]] = True
-        blue_points[empty_points[:, 0], empty_points[:, 1]] = False
-
-    elif len(red_markers) == 0:
-        blue_markers = np.array(red_markers)
-        empty_points = np.argwhere(np.all(grid == 0, axis=2))
-        red_points = np.zeros((size, size), dtype=bool)
-        blue_points = np.zeros((size, size), dtype=bool)
-        red_points[empty_points[:, 0], empty_points[:, 1]] = False
-        blue_points[empty_points[:, 0], empty_points[:, 1]] = True
-        
-    else:
-        red_markers = np.array(red_markers)
-        blue_markers = np.array(blue_markers)
+def nearest_distances(markers, rows, cols):
+    """Squared distance from every cell of a block to the nearest marker.
+
+    rows and cols are the int32 coordinates spanned by the block; markers are
+    folded in one at a time so memory stays at two block-sized arrays.
+    """
+    nearest = np.full((len(rows), len(cols)), np.iinfo(np.int32).max, dtype=np.int32)
+    dist = np.empty_like(nearest)
+    for x, y in markers:
+        np.add(((rows - x)**2)[:, np.newaxis], ((cols - y)**2)[np.newaxis, :], out=dist)
+        np.minimum(nearest, dist, out=nearest)
+    return nearest
+
+def edt_nearest_distances(markers, size):
+    """Squared distance from every cell to the nearest marker via a distance transform.
 
-        empty_points = np.argwhere(np.all(grid == 0, axis=2))
+    scipy's exact Euclidean distance transform finds the nearest marker of
+    every cell in time linear in the number of cells, whatever the number of
+    markers. The squared distance is then recomputed in integers from the
+    returned marker coordinates, so it equals the brute-force value exactly.
+    """
+    from scipy.ndimage import distance_transform_edt
+
+    seeds = np.ones((size, size), dtype=bool)
+    seeds[tuple(np.asarray(markers).T)] = False
+    nearest_x, nearest_y = distance_transform_edt(seeds, return_distances=False, return_indices=True)
+    axis = np.arange(size, dtype=np.int32)
+    return (nearest_x - axis[:, np.newaxis])**2 + (nearest_y - axis[np.newaxis, :])**2
+
+def calculate_voronoi_points(grid, red_markers, blue_markers, max_memory=2**24, backend="brute"):
+    """Calculate the red and blue points based on the Voronoi diagram.
+
+    With backend="brute" the board is processed in blocks of rows sized so
+    the int32 distance arrays stay within max_memory bytes, which keeps large
+    boards with many markers in bounded memory. Distances are compared
+    squared, so boards up to 32768 cells wide fit in int32. backend="edt"
+    takes the distances from edt_nearest_distances instead, whose cost does
+    not grow with the number of markers; the result is identical.
+    """
+    if backend not in ("brute", "edt"):
+        raise ValueError("Unknown backend {!r}".format(backend))
+    size = grid.shape[0]
+    empty = ~grid[:, :, :2].any(axis=2)
+    red_points = np.zeros((size, size), dtype=bool)
+    blue_points = np.zeros((size, size), dtype=bool)
 
-        red_dist = np.sqrt(np.sum((empty_points[:, np.newaxis, :] - red_markers[np.newaxis, :, :]) ** 2, axis=2)).min(axis=1)
-        blue_dist = np.sqrt(np.sum((empty_points[:, np.newaxis, :] - blue_markers[np.newaxis, :, :]) ** 2, axis=2)).min(axis=1)
+    if len(red_markers) == 0 and len(blue_markers) == 0:
+        return red_points, blue_points
+    if len(blue_markers) == 0:
+        red_points[empty] = True
+        return red_points, blue_points
+    if len(red_markers) == 0:
+        blue_points[empty] = True
+        return red_points, blue_points
 
-        red_points = np.zeros((size, size), dtype=bool)
-        blue_points = np.zeros((size, size), dtype=bool)
+    red_markers = np.asarray(red_markers, dtype=np.int32)
+    blue_markers = np.asarray(blue_markers, dtype=np.int32)
+    if backend == "edt":
+        red_dist = edt_nearest_distances(red_markers, size)
+        blue_dist = edt_nearest_distances(blue_markers, size)
+        return empty & (red_dist < blue_dist), empty & (blue_dist < red_dist)
 
-        red_points[empty_points[:, 0], empty_points[:, 1]] = red_dist < blue_dist
-        blue_points[empty_points[:, 0], empty_points[:, 1]] = blue_dist < red_dist
+    axis = np.arange(size, dtype=np.int32)
+    # Red and blue minima plus the distance field being folded in, 4 bytes each
+    rows_per_block = max(1, max_memory // (3 * 4 * size))
+    for start in range(0, size, rows_per_block):
+        stop = min(start + rows_per_block, size)
+        red_dist = nearest_distances(red_markers, axis[start:stop], axis)
+        blue_dist = nearest_distances(blue_markers, axis[start:stop], axis)
+        red_points[start:stop] = empty[start:stop] & (red_dist < blue_dist)
+        blue_points[start:stop] = empty[start:stop] & (blue_dist < red_dist)
 
     return red_points, blue_points
 
+def replay_state(current_state, size=100, quarantine_distance=5):
+    """Rebuild the grid and the first and second mover's markers from cell ids in play order."""
+    grid = initialize_grid(size)
+    first, second = [], []
+    for i, cell in enumerate(current_state):
+        x, y = divmod(int(cell), size)
+        place_marker(grid, x, y, 1 + i % 2, quarantine_distance)
+        (first if i % 2 == 0 else second).append((x, y))
+    return grid, first, second
+
+def isqrt(values):
+    """Elementwise integer square root of a non-negative int64 array."""
+    root = np.floor(np.sqrt(values)).astype(np.int64)
+    root -= root * root > values
+    root += (root + 1) * (root + 1) <= values
+    return root
+
+def gain_map(grid, own_markers, opponent_markers, max_memory=2**24):
+    """Cells the side to move would gain by placing a marker on each cell.
+
+    Returns a (size, size) float array holding, for every legal cell c, how
+    many cells the mover's colour would own after playing c minus how many
+    it owns now, and -inf for cells that are occupied or quarantined. A cell
+    p that the mover does not own yet is won by c when |p - c|^2 is below the
+    squared distance from p to the nearest opponent marker, so each such p
+    adds one to every c in an open disk around it. The disks are summed row
+    by row with difference arrays in one pass; c itself always becomes a
+    marker cell, which is the -1. Disk rows are processed in chunks of at
+    most max_memory bytes.
+    """
+    size = grid.shape[0]
+    empty = ~grid[:, :, :2].any(axis=2)
+    legal = ~grid.any(axis=2)
+    gain = np.full((size, size), -np.inf)
+    if len(opponent_markers) == 0:
+        # With no opponent on the board the mover ends up owning every empty cell
+        owned = np.sum(empty) if len(own_markers) > 0 else 0
+        gain[legal] = np.sum(empty) - 1 - owned
+        return gain
+
+    axis = np.arange(size, dtype=np.int32)
+    opponent_dist = nearest_distances(np.asarray(opponent_markers, dtype=np.int32), axis, axis).astype(np.int64)
+    if len(own_markers) > 0:
+        own_dist = nearest_distances(np.asarray(own_markers, dtype=np.int32), axis, axis)
+        contested = empty & ~(own_dist < opponent_dist)
+    else:
+        contested = empty
+    px, py = np.nonzero(contested)
+    reach = opponent_dist[px, py] - 1  # largest squared distance still strictly closer
+    radius = isqrt(reach)
+
+    diff = np.zeros(size * (size + 1), dtype=np.int64)
+    rows = 2 * radius + 1
+    ends = np.cumsum(rows)
+    # About eight int64 temporaries per disk row
+    chunk_rows = max(1, max_memory // (8 * 8))
+    start = 0
+    while start < len(px):
+        stop = max(start + 1, np.searchsorted(ends, ends[start] - rows[start] + chunk_rows, side='right'))
+        counts = rows[start:stop]
+        owner = np.repeat(np.arange(start, stop), counts)
+        first = np.repeat(np.cumsum(counts) - counts, counts)
+        dx = np.arange(len(owner)) - first - radius[owner]
+        cx = px[owner] + dx
+        half = isqrt(reach[owner] - dx * dx)
+        lo = np.maximum(py[owner] - half, 0)
+        hi = np.minimum(py[owner] + half, size - 1)
+        keep = (cx >= 0) & (cx < size) & (lo <= hi)
+        base = cx[keep] * (size + 1)
+        diff += np.bincount(base + lo[keep], minlength=len(diff))
+        diff -= np.bincount(base + hi[keep] + 1, minlength=len(diff))
+        start = stop
+    won = np.cumsum(diff.reshape(size, size + 1), axis=1)[:, :size]
+    gain[legal] = won[legal] - 1
+    return gain
+
+def state_gain_map(current_state, size=100, quarantine_distance=5):
+    """gain_map for the side to move after the cell ids in current_state."""
+    grid, first, second = replay_state(current_state, size, quarantine_distance)
+    own, opponent = (first, second) if len(current_state) % 2 == 0 else (second, first)
+    return gain_map(grid, own, opponent)
+
+class VoronoiOwnership:
+    """Incremental Voronoi ownership of the board.
+
+    Keeps the squared distance from every cell to its nearest red and nearest
+    blue marker, so placing a marker only folds in that marker's distance
+    field instead of recomputing against all markers. points() follows the
+    same rules as calculate_voronoi_points: marker cells and ties belong to
+    nobody, and a colour with no markers owns nothing.
+    """
+    FAR = np.iinfo(np.int32).max
+
+    def __init__(self, size, max_memory=2**24):
+        self.size = size
+        self.red_dist = np.full((size, size), self.FAR, dtype=np.int32)
+        self.blue_dist = np.full((size, size), self.FAR, dtype=np.int32)
+        self.occupied = np.zeros((size, size), dtype=bool)
+        self.axis = np.arange(size, dtype=np.int32)
+        # Rows per block of the temporary distance field built in place()
+        self.rows_per_block = max(1, max_memory // (4 * size))
+
+    def place(self, x, y, player):
+        """Fold the distance field of a new marker into the nearest distances."""
+        nearest = self.red_dist if player == 1 else self.blue_dist
+        dy = ((self.axis - y)**2)[np.newaxis, :]
+        for start in range(0, self.size, self.rows_per_block):
+            stop = min(start + self.rows_per_block, self.size)
+            dist = ((self.axis[start:stop] - x)**2)[:, np.newaxis] + dy
+            np.minimum(nearest[start:stop], dist, out=nearest[start:stop])
+        self.occupied[x, y] = True
+
+    def points(self):
+        """Return the red and blue points, as calculate_voronoi_points would."""
+        empty = ~self.occupied
+        red_points = empty & (self.red_dist < self.blue_dist)
+        blue_points = empty & (self.blue_dist < self.red_dist)
+        return red_points, blue_points
+
+    def area_percentage(self):
+        """Return the red and blue area percentages."""
+        return calculate_area_percentage(*self.points())
+
 def calculate_area_percentage(red_points, blue_points):
     """Calculate the area percentage occupied by red and blue points."""
     total_area = red_points.size
@@ -81,42 +267,274 @@ def calculate_area_percentage(red_points, blue_points):
     blue_percentage = (blue_area / total_area) * 100
     return red_percentage, blue_percentage
 
-def simulate_game(size=100, num_turns=5, quarantine_distance=5):
-    """Simulate a game and return the final grid and outcome."""
+def clip_polygon(polygon, a, b, c):
+    """Clip a convex polygon, given as a list of (x, y), to the half-plane a*x + b*y <= c."""
+    clipped = []
+    for i, (px, py) in enumerate(polygon):
+        qx, qy = polygon[(i + 1) % len(polygon)]
+        p_in = a * px + b * py <= c
+        q_in = a * qx + b * qy <= c
+        if p_in:
+            clipped.append((px, py))
+        if p_in != q_in:
+            t = (c - a * px - b * py) / (a * (qx - px) + b * (qy - py))
+            clipped.append((px + t * (qx - px), py + t * (qy - py)))
+    return clipped
+
+def polygon_area(polygon):
+    """Area of a simple polygon by the shoelace formula."""
+    if len(polygon) < 3:
+        return 0.0
+    xs, ys = np.array(polygon).T
+    return 0.5 * abs(np.dot(xs, np.roll(ys, -1)) - np.dot(ys, np.roll(xs, -1)))
+
+def voronoi_cell_area(site, others, size):
+    """Area of the Voronoi cell of site among others, clipped to the board.
+
+    The board is the union of the size x size unit cells centred on the grid
+    points, i.e. the square [-0.5, size - 0.5]^2.
+    """
+    lo, hi = -0.5, size - 0.5
+    cell = [(lo, lo), (hi, lo), (hi, hi), (lo, hi)]
+    px, py = site
+    for qx, qy in others:
+        # Points at least as close to site as to (qx, qy)
+        cell = clip_polygon(cell, 2 * (qx - px), 2 * (qy - py), qx**2 + qy**2 - px**2 - py**2)
+        if not cell:
+            break
+    return polygon_area(cell)
+
+def calculate_exact_area_percentage(red_markers, blue_markers, size=100, cross_check=False, tolerance=1.0):
+    """Calculate red and blue area percentages from the exact Voronoi diagram.
+
+    Each marker's Voronoi cell is clipped to the board as a polygon and the
+    cells are summed per colour, so the cost depends on the number of markers
+    and not on the board size. Unlike the raster scorer, marker cells and
+    cells on a tie line are not dropped. With cross_check=True the raster
+    result is computed too and a ValueError is raised if either colour
+    differs by more than tolerance percentage points.
+    """
+    red_markers = [tuple(marker) for marker in red_markers]
+    blue_markers = [tuple(marker) for marker in blue_markers]
+    markers = red_markers + blue_markers
+    areas = [voronoi_cell_area(site, markers[:i] + markers[i + 1:], size) for i, site in enumerate(markers)]
+    total_area = size * size
+    red_percentage = (sum(areas[:len(red_markers)]) / total_area) * 100
+    blue_percentage = (sum(areas[len(red_markers):]) / total_area) * 100
+
+    if cross_check:
+        ownership = VoronoiOwnership(size)
+        for x, y in red_markers:
+            ownership.place(x, y, 1)
+        for x, y in blue_markers:
+            ownership.place(x, y, 2)
+        raster_red, raster_blue = ownership.area_percentage()
+        if abs(raster_red - red_percentage) > tolerance or abs(raster_blue - blue_percentage) > tolerance:
+            raise ValueError("Exact areas ({:.4f}, {:.4f}) differ from raster areas ({:.4f}, {:.4f})".format(
+                red_percentage, blue_percentage, raster_red, raster_blue))
+    return red_percentage, blue_percentage
+
+def batch_area_percentage(markers, players, size=100, max_memory=2**22):
+    """Calculate red and blue area percentages for many games at once.
+
+    markers has shape (G, turns, 2) holding (x, y) per placed marker and
+    players holds the 1/2 label of each marker, either shared as (turns,) or
+    per game as (G, turns). Games are scored in chunks whose distance tensors
+    stay within max_memory bytes. The result matches calculate_voronoi_points
+    followed by calculate_area_percentage for every game.
+    """
+    markers = np.asarray(markers, dtype=np.int32)
+    num_games, num_markers = markers.shape[:2]
+    is_red = np.broadcast_to(np.asarray(players) == 1, (num_games, num_markers))
+    is_blue = np.broadcast_to(np.asarray(players) == 2, (num_games, num_markers))
+    far = np.iinfo(np.int32).max
+    axis = np.arange(size, dtype=np.int32)
+
+    # Two running minima plus the distance field of the marker being folded in.
+    # Boards too big for one game per chunk are split into blocks of rows.
+    bytes_per_row = 4 * size * 4
+    chunk = max(1, max_memory // (bytes_per_row * size))
+    rows_per_block = size if chunk > 1 else max(1, min(size, max_memory // bytes_per_row))
+
+    red_percentage = np.zeros(num_games)
+    blue_percentage = np.zeros(num_games)
+    total_area = size * size
+    for start in range(0, num_games, chunk):
+        stop = min(start + chunk, num_games)
+        dy = (axis[np.newaxis, :, np.newaxis] - markers[start:stop, np.newaxis, :, 1])**2
+        red_area = np.zeros(stop - start, dtype=np.int64)
+        blue_area = np.zeros(stop - start, dtype=np.int64)
+        for row in range(0, size, rows_per_block):
+            row_stop = min(row + rows_per_block, size)
+            dx = (axis[np.newaxis, row:row_stop, np.newaxis] - markers[start:stop, np.newaxis, :, 0])**2
+            red_dist = np.full((stop - start, row_stop - row, size), far, dtype=np.int32)
+            blue_dist = np.full((stop - start, row_stop - row, size), far, dtype=np.int32)
+            dist = np.empty_like(red_dist)
+            for k in range(num_markers):
+                np.add(dx[:, :, np.newaxis, k], dy[:, np.newaxis, :, k], out=dist)
+                for nearest, own in ((red_dist, is_red[start:stop, k]), (blue_dist, is_blue[start:stop, k])):
+                    if own.all():
+                        np.minimum(nearest, dist, out=nearest)
+                    elif own.any():
+                        np.minimum(nearest, np.where(own[:, np.newaxis, np.newaxis], dist, far), out=nearest)
+            empty = np.minimum(red_dist, blue_dist) != 0
+
+            red_area += np.sum(empty & (red_dist < blue_dist), axis=(1, 2))
+            blue_area += np.sum(empty & (blue_dist < red_dist), axis=(1, 2))
+        red_percentage[start:stop] = (red_area / total_area) * 100
+        blue_percentage[start:stop] = (blue_area / total_area) * 100
+    return red_percentage, blue_percentage
+
+def score_moves(moves, size=100, max_memory=2**22, exact=False):
+    """Score games given as rows of cell ids in Move_i_Pj order.
+
+    Moves alternate between P1 (red) and P2 (blue), so this returns the
+    Area_P1 and Area_P2 columns of the dataset schema. exact=True scores
+    each game with calculate_exact_area_percentage instead of the raster.
+    """
+    moves = np.asarray(moves)
+    if moves.size == 0:
+        return np.zeros(len(moves)), np.zeros(len(moves))
+    x, y = np.divmod(moves, size)
+    if exact:
+        markers = np.stack([x, y], axis=2).tolist()
+        areas = [calculate_exact_area_percentage(game[0::2], game[1::2], size) for game in markers]
+        red_percentage, blue_percentage = np.array(areas).reshape(-1, 2).T
+        return red_percentage, blue_percentage
+    players = 1 + np.arange(moves.shape[1]) % 2
+    return batch_area_percentage(np.stack([x, y], axis=2), players, size, max_memory)
+
+def play_random_game(size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False):
+    """Play a game between two random players and return its moves as cell ids."""
     grid = initialize_grid(size)
     markers = []
-    red_markers = []
-    blue_markers = []
     player = 1  # Red player starts
 
     for _ in range(num_turns * 2):
-        valid_move = False
-        while not valid_move:
-            x = random.randint(0, size - 1)
-            y = random.randint(0, size - 1)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-        place_marker(grid, x, y, player)
-        if player == 1:
-            markers.append(size*x + y)
-            red_markers.append((x,y))
-        else:
-            markers.append(size*x + y)
-            blue_markers.append((x,y))
+        x, y = sample_legal_move(grid, rejection_sampling)
+        place_marker(grid, x, y, player, quarantine_distance)
+        markers.append(size*x + y)
         player = 2 if player == 1 else 1  # Switch player
 
-    red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
-    red_percentage, blue_percentage = calculate_area_percentage(red_points, blue_points)
+    return markers
+
+def stamp_quarantine(masks, x, y, quarantine_distance):
+    """Stamp one quarantine disk per game into a (G, size, size) board mask stack."""
+    size = masks.shape[1]
+    dx, dy = quarantine_disk(quarantine_distance)
+    qx = np.asarray(x)[:, np.newaxis] + dx
+    qy = np.asarray(y)[:, np.newaxis] + dy
+    on_board = (qx >= 0) & (qx < size) & (qy >= 0) & (qy < size)
+    games = np.broadcast_to(np.arange(len(masks))[:, np.newaxis], qx.shape)
+    masks[games[on_board], qx[on_board], qy[on_board]] = True
+
+def sample_legal_moves(masks, rng, proposals=None, max_retries=16):
+    """Draw one legal cell id per game, uniformly, from a (G, size, size) mask stack.
+
+    Most boards are nearly empty, so cells are drawn at random and only the
+    games that hit a quarantined cell redraw. Games still unlucky after
+    max_retries rounds pick the best of a random key over their legal cells.
+    If proposals are given, games whose proposed cell is legal keep it and
+    only the rest are drawn at random, like the model fallback path.
+    """
+    num_games = len(masks)
+    flat = masks.reshape(num_games, -1)
+    if proposals is None:
+        cells = rng.integers(0, flat.shape[1], size=num_games)
+        pending = np.flatnonzero(flat[np.arange(num_games), cells])
+    else:
+        cells = np.array(proposals, dtype=np.int64)
+        off_board = (cells < 0) | (cells >= flat.shape[1])
+        cells[off_board] = 0
+        pending = np.flatnonzero(off_board | flat[np.arange(num_games), cells])
+    for _ in range(max_retries):
+        if len(pending) == 0:
+            return cells
+        cells[pending] = rng.integers(0, flat.shape[1], size=len(pending))
+        pending = pending[flat[pending, cells[pending]]]
+    if len(pending) > 0:
+        if flat[pending].all(axis=1).any():
+            raise ValueError("No legal moves left on the board")
+        keys = rng.random((len(pending), flat.shape[1]))
+        keys[flat[pending]] = -1
+        cells[pending] = keys.argmax(axis=1)
+    return cells
+
+def play_games_lockstep(num_games, size=100, num_turns=5, quarantine_distance=5, rng=None, policies=None, start_moves=None):
+    """Play many games in lockstep and return their moves.
+
+    Every game advances one move per step, with the boards held as a single
+    (G, size, size) quarantine mask stack. policies maps a player (1 moves
+    first) to a callable that takes the (G, i) array of moves played so far
+    and returns one proposed cell id per game; illegal proposals and players
+    without a policy get a random legal move. start_moves, a (G, i) array
+    of opening moves, lets the games continue from positions already
+    reached. Returns a (G, 2 * num_turns) array of cell ids in Move_i_Pj order.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    policies = policies or {}
+    masks = np.zeros((num_games, size, size), dtype=bool)
+    moves = np.empty((num_games, 2 * num_turns), dtype=np.int64)
+    start = 0
+    if start_moves is not None:
+        start_moves = np.asarray(start_moves, dtype=np.int64).reshape(num_games, -1)
+        start = start_moves.shape[1]
+        moves[:, :start] = start_moves
+        for i in range(start):
+            x, y = np.divmod(start_moves[:, i], size)
+            stamp_quarantine(masks, x, y, quarantine_distance)
+    for i in range(start, 2 * num_turns):
+        policy = policies.get(1 + i % 2)
+        proposals = None if policy is None else policy(moves[:, :i])
+        cells = sample_legal_moves(masks, rng, proposals)
+        x, y = np.divmod(cells, size)
+        stamp_quarantine(masks, x, y, quarantine_distance)
+        moves[:, i] = cells
+    return moves
+
+def play_random_games(num_games, size=100, num_turns=5, quarantine_distance=5, rng=None):
+    """Play many games between random players in lockstep and return their moves."""
+    return play_games_lockstep(num_games, size, num_turns, quarantine_distance, rng)
 
-    return markers + [red_percentage, blue_percentage]
+def simulate_game(size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False):
+    """Simulate a game and return the final grid and outcome."""
+    markers = play_random_game(size, num_turns, quarantine_distance, rejection_sampling)
+    red_percentage, blue_percentage = score_moves([markers], size)
+
+    return markers + [red_percentage[0], blue_percentage[0]]
 
-def generate_dataset(num_games, size=100, num_turns=5, quarantine_distance=5):
-    """Generates a dataset of games."""
+def generate_dataset(num_games, size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False, lockstep=False, seed=None, batch_size=2000, stats_path=None):
+    """Generates a dataset of games.
+
+    With lockstep=True the games are played batch_size at a time as NumPy
+    arrays by play_random_games, seeded from seed, instead of one by one.
+    With stats_path set, play and scoring times are appended there as a
+    JSON line (see profiling.Profiler).
+    """
+    # Imported here so the board helpers load without pandas, e.g. for game.py
+    import pandas as pd
+    from tqdm import tqdm
+    if stats_path is not None:
+        profiler.enable()
     columns = ['Move_{}_P{}'.format(i + 1, 1 + i % 2) for i in range(2 * num_turns)] + ['Area_P1', 'Area_P2']
-    data = []
-    for _ in tqdm(range(num_games), desc="Generating games"):
-        game_data = simulate_game(size, num_turns, quarantine_distance)
-        data.append(game_data)
-    return pd.DataFrame(data, columns=columns)
+    moves = []
+    if lockstep:
+        rng = np.random.default_rng(seed)
+        for start in tqdm(range(0, num_games, batch_size), desc="Generating batches"):
+            batch = min(batch_size, num_games - start)
+            with profiler.phase("play"):
+                moves.extend(play_random_games(batch, size, num_turns, quarantine_distance, rng).tolist())
+    else:
+        for _ in tqdm(range(num_games), desc="Generating games"):
+            with profiler.phase("play"):
+                moves.append(play_random_game(size, num_turns, quarantine_distance, rejection_sampling))
+    dataset = pd.DataFrame(np.reshape(moves, (-1, 2 * num_turns)), columns=columns[:-2])
+    with profiler.phase("scoring"):
+        dataset['Area_P1'], dataset['Area_P2'] = score_moves(moves, size)
+    if stats_path is not None:
+        profiler.write(stats_path, games=num_games, driver="generate_dataset")
+        profiler.disable()
+    return dataset
 
 if __name__ =="__main__":
     num_games = 100
@@ -1,21 +1,18 @@
 import pygame
+import os
 import sys
+import threading
 import numpy as np
-import pandas as pd
 import random
-from datagen import initialize_grid, is_valid_move, place_marker, calculate_voronoi_points, calculate_area_percentage
-from voronoi_knn import model
+from datagen import initialize_grid, is_valid_move, place_marker, sample_legal_move, calculate_area_percentage, VoronoiOwnership
+from render import BoardRenderer
+from aimove import MoveRequest
 
-# Initialize Pygame
-pygame.init()
-pygame.font.init()  # Initialize font module
-
-# Screen setup
+# Screen setup; the window itself is opened by init_display
 size = 100
 cell_size = 10
 screen_width, screen_height = size*cell_size, size*cell_size
-screen = pygame.display.set_mode((screen_width, screen_height))
-pygame.display.set_caption("Voronoi Game")
+screen = None
 
 # Colors
 RED = (255, 0, 0)
@@ -75,26 +72,57 @@ button_width = 200
 button_height = 50
 x_human, x_ai = size*cell_size//2 - button_width//2, size*cell_size//2 - button_width//2
 y_human, y_ai = size*cell_size//2 - 3*button_height//2, size*cell_size//2 + button_height//2
-button_human = Button("Human Starts", x_human, y_human, button_width, button_height, RED, (200, 0, 0), lambda: set_game_state('human'))
-button_ai = Button("AI Starts", x_ai, y_ai, button_width, button_height, BLUE, (0, 0, 200), lambda: set_game_state('ai'))
 
 game_state = 'menu'
 start_player = 'ai'
-data = pd.read_csv("datasets/combined.csv")
+# Seconds to wait for the AI before playing a random legal move instead
+AI_TIMEOUT = 10
+
+def init_display():
+    """Open the window and create the widgets that need pygame running."""
+    global screen, button_human, button_ai, renderer, clock
+    pygame.init()
+    pygame.font.init()  # Initialize font module
+    screen = pygame.display.set_mode((screen_width, screen_height))
+    pygame.display.set_caption("Voronoi Game")
+    button_human = Button("Human Starts", x_human, y_human, button_width, button_height, RED, (200, 0, 0), lambda: set_game_state('human'))
+    button_ai = Button("AI Starts", x_ai, y_ai, button_width, button_height, BLUE, (0, 0, 200), lambda: set_game_state('ai'))
+    renderer = BoardRenderer(screen, size, cell_size)
+    clock = pygame.time.Clock()
+
+# The AI and its dataset, loaded once per session by load_ai
+ai_model = None
+data = None
+ai_lock = threading.Lock()
+
+def load_ai():
+    """Import and load the AI on first use and return (model, data).
+
+    sklearn and the dataset are only pulled in here, and the dataset comes
+    from its prebuilt snapshot (voronoi_knn.load_snapshot), so the menu is
+    up before any of it is needed. Run with --rollout to play against the
+    Monte Carlo player instead of KNN.
+    """
+    global ai_model, data
+    with ai_lock:
+        if ai_model is None:
+            if "--rollout" in sys.argv:
+                from rollout import RolloutPlayer
+                ai_model = RolloutPlayer(size=size, workers=os.cpu_count())
+            else:
+                from voronoi_knn import model, load_snapshot
+                data = load_snapshot("datasets/combined.csv")
+                ai_model = model
+    return ai_model, data
+
+def ai_move(current_state, data=None, red_points=None):
+    """Ask the AI for a move, waiting for load_ai if the preload has not finished."""
+    model, dataset = load_ai()
+    return model(current_state=current_state, data=dataset, red_points=red_points)
 
 def draw_grid(markers, red_points, blue_points, size=100, cell_size=10):
-    for x in range(size):
-        for y in range(size):
-            rect = pygame.Rect(x*cell_size, y*cell_size, cell_size, cell_size)
-            if (x,y) in markers:
-                pygame.draw.rect(screen, BLACK, rect)
-            elif bool(red_points[x, y]) is True:
-                pygame.draw.rect(screen, RED, rect)
-            elif bool(blue_points[x, y]) is True:
-                pygame.draw.rect(screen, BLUE, rect)
-            # else:
-            #     pygame.draw.rect(screen, BLACK, rect)
-    pygame.display.update()
+    """Draw the board through the shared renderer, repainting only what changed."""
+    renderer.draw(markers, red_points, blue_points)
 
 def game_loop():
     global game_state, start_player, size, cell_size
@@ -104,51 +132,65 @@ def game_loop():
     # Initialize game state
     grid = initialize_grid(size)
     markers = []
-    red_markers = []
-    blue_markers = []
+    ownership = VoronoiOwnership(size)
     player = 1 if start_player == 'ai' else 2  # Determine who starts based on selection
     current_state = []
     moves = 0
-    red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
+    red_points, blue_points = ownership.points()
+    renderer.invalidate()
+
+    request = None
 
     while game_state == 'playing' and moves < 2*num_turns:
-        if player == 1:  # AI's turn
-            action = model(current_state=current_state, data=data, red_points=red_points)
-            x, y = divmod(action, size)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            # print(x, y)
-            place_marker(grid, x, y, player)
-            markers.append((x,y))
-            current_state.append(size*x+y)
-            red_markers.append((x,y))
-            moves += 1
-            player = 2
+        events = pygame.event.get()
+        if any(event.type == pygame.QUIT for event in events):
+            if request is not None:
+                request.cancel()
+            pygame.display.set_caption("Voronoi Game")
+            game_state = 'menu'  # Return to menu or exit
+            return
+
+        if player == 1:  # AI's turn, computed off the event loop
+            if request is None:
+                request = MoveRequest(ai_move, current_state, None, red_points, timeout=AI_TIMEOUT)
+            if not request.done():
+                pygame.display.set_caption(f"Voronoi Game - AI thinking ({request.elapsed():.0f}s)")
+            else:
+                action = request.result()
+                request = None
+                pygame.display.set_caption("Voronoi Game")
+                if action is None:
+                    x, y = sample_legal_move(grid)
+                else:
+                    x, y = divmod(int(action), size)
+                    if not is_valid_move(grid, x, y):
+                        x, y = sample_legal_move(grid)
+
+                # print(x, y)
+                place_marker(grid, x, y, player, quarantine_distance)
+                markers.append((x,y))
+                current_state.append(size*x+y)
+                ownership.place(x, y, player)
+                moves += 1
+                player = 2
         else:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    game_state = 'menu'  # Return to menu or exit
-                    return
-                elif event.type == pygame.MOUSEBUTTONDOWN: # Human's turn
+            for event in events:
+                if event.type == pygame.MOUSEBUTTONDOWN: # Human's turn
                     x, y = pygame.mouse.get_pos()
                     x //= cell_size
                     y //= cell_size
-                    if is_valid_move(grid, x, y, quarantine_distance, player):
-                        place_marker(grid, x, y, player)
+                    if is_valid_move(grid, x, y):
+                        place_marker(grid, x, y, player, quarantine_distance)
                         markers.append((x, y))
-                        blue_markers.append((x, y))
+                        ownership.place(x, y, player)
                         current_state.append(size * x + y)
                         player = 1  # Switch to AI
                         moves += 1
+                        break
 
-        red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
+        red_points, blue_points = ownership.points()
         draw_grid(markers, red_points, blue_points, size, cell_size)
-        pygame.display.flip()
+        clock.tick(60)
 
     pygame.time.wait(2000)
     red_percentage, blue_percentage = calculate_area_percentage(red_points, blue_points)
@@ -166,6 +208,10 @@ def game_loop():
     print("Exiting game loop")
 
 if __name__ == "__main__":
+    init_display()
+    # Load the AI in the background while the menu is already showing
+    threading.Thread(target=load_ai, daemon=True).start()
+
     # Main event loop
     while True:
         for event in pygame.event.get():
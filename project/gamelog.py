@@ -0,0 +1,86 @@
+import csv
+import json
+import os
+
+class GameLogWriter:
+    """Stream game rows to a CSV in fixed-size chunks with a resumable checkpoint.
+
+    Rows are buffered and appended to name_to_save every chunk_size games.
+    After each flush a checkpoint next to the CSV records how many games are
+    on disk, the byte length of the file at that point and the outcome
+    counts, so a crashed run can pick up from the last flushed chunk. The
+    checkpoint is kept, marked complete, once the run finishes.
+    """
+    def __init__(self, name_to_save, columns, chunk_size=500, resume=False):
+        self.path = name_to_save
+        self.checkpoint_path = name_to_save + ".ckpt"
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffer_counts = {}
+
+        checkpoint = read_checkpoint(name_to_save) if resume else None
+        if checkpoint is not None and checkpoint["columns"] == list(columns):
+            self.games = checkpoint["games"]
+            self.counts = checkpoint["counts"]
+            self.complete = checkpoint["complete"]
+            # Drop anything written after the last checkpoint
+            with open(self.path, 'r+') as file:
+                file.truncate(checkpoint["bytes"])
+        else:
+            self.games = 0
+            self.counts = {}
+            self.complete = False
+            with open(self.path, 'w', newline='') as file:
+                csv.writer(file).writerow(columns)
+        self.columns = list(columns)
+        self.save_checkpoint()
+
+    def append(self, row, outcome=None):
+        """Buffer one game row, flushing once a full chunk is waiting."""
+        self.buffer.append(row)
+        if outcome is not None:
+            self.buffer_counts[outcome] = self.buffer_counts.get(outcome, 0) + 1
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows to the CSV and checkpoint the new position."""
+        if not self.buffer:
+            return
+        with open(self.path, 'a', newline='') as file:
+            csv.writer(file).writerows(self.buffer)
+            file.flush()
+            os.fsync(file.fileno())
+        self.games += len(self.buffer)
+        for outcome, count in self.buffer_counts.items():
+            self.counts[outcome] = self.counts.get(outcome, 0) + count
+        self.buffer = []
+        self.buffer_counts = {}
+        self.save_checkpoint()
+
+    def close(self):
+        """Flush what is left and mark the run complete."""
+        self.flush()
+        self.complete = True
+        self.save_checkpoint()
+
+    def save_checkpoint(self):
+        checkpoint = {
+            "games": self.games,
+            "bytes": os.path.getsize(self.path),
+            "counts": self.counts,
+            "columns": self.columns,
+            "complete": self.complete,
+        }
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(tmp_path, self.checkpoint_path)
+
+def read_checkpoint(name_to_save):
+    """Return the checkpoint recorded for name_to_save, or None if there is none."""
+    checkpoint_path = name_to_save + ".ckpt"
+    if not os.path.exists(checkpoint_path) or not os.path.exists(name_to_save):
+        return None
+    with open(checkpoint_path) as file:
+        return json.load(file)
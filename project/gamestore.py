@@ -0,0 +1,157 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# A game store is a directory holding one .npy file for the moves and one for
+# the areas, stored column-major so every dataset column is a contiguous,
+# memory-mappable slice, plus a small manifest describing the schema.
+STORE_FORMAT = "voronoi-game-store"
+STORE_VERSION = 2
+STORE_SUFFIX = ".vgs"
+MOVE_DTYPE = np.int16
+AREA_DTYPE = np.float32
+COUNT_DTYPE = np.int32
+# Per-record weight and spread written by compact_dataset
+SUMMARY_COLUMNS = ['Count', 'Area_P1_Std', 'Area_P2_Std']
+
+def store_path_for(csv_path):
+    """Default store location for a CSV dataset: same name with the .vgs suffix."""
+    return os.path.splitext(csv_path)[0] + STORE_SUFFIX
+
+def dataset_columns(num_moves):
+    return ['Move_{}_P{}'.format(i + 1, 1 + i % 2) for i in range(num_moves)] + ['Area_P1', 'Area_P2']
+
+def normalize_games(data):
+    """Return the Move_i_Pj/Area_P1/Area_P2 columns of a dataset by position.
+
+    Columns are taken positionally after the Move_ headers and renamed to the
+    standard schema, and rows with missing values are dropped, so CSVs with a
+    damaged header line still convert. The weight columns of a compacted
+    dataset are carried along when present.
+    """
+    num_moves = sum(str(column).startswith("Move_") for column in data.columns)
+    games = data.iloc[:, :num_moves + 2].dropna().set_axis(dataset_columns(num_moves), axis=1)
+    for column in SUMMARY_COLUMNS:
+        if column in data.columns:
+            games[column] = data.loc[games.index, column]
+    return games
+
+def compact_dataset(data):
+    """Collapse identical games into one weighted record each.
+
+    Every distinct move sequence keeps its mean areas and gains a Count of
+    how many times it was played plus the standard deviation of its areas.
+    Already compacted input is merged by summing counts and weighting means.
+    """
+    games = normalize_games(data)
+    move_columns = [column for column in games.columns if column.startswith("Move_")]
+    counts = games["Count"] if "Count" in games.columns else pd.Series(1, index=games.index)
+    weighted = pd.DataFrame({
+        "Count": counts,
+        "P1": games["Area_P1"] * counts,
+        "P2": games["Area_P2"] * counts,
+        "P1_sq": (games["Area_P1"]**2 + games.get("Area_P1_Std", 0)**2) * counts,
+        "P2_sq": (games["Area_P2"]**2 + games.get("Area_P2_Std", 0)**2) * counts,
+    })
+    grouped = weighted.groupby([games[column] for column in move_columns], sort=False).sum()
+    compact = grouped.index.to_frame(index=False)
+    count = grouped["Count"].to_numpy()
+    compact["Area_P1"] = grouped["P1"].to_numpy() / count
+    compact["Area_P2"] = grouped["P2"].to_numpy() / count
+    compact["Count"] = count
+    compact["Area_P1_Std"] = np.sqrt(np.maximum(grouped["P1_sq"].to_numpy() / count - compact["Area_P1"]**2, 0))
+    compact["Area_P2_Std"] = np.sqrt(np.maximum(grouped["P2_sq"].to_numpy() / count - compact["Area_P2"]**2, 0))
+    return compact
+
+def dataframe_to_store(data, store_path):
+    """Write a dataset DataFrame, plain or compacted, as a game store."""
+    games = normalize_games(data)
+    move_columns = [column for column in games.columns if column.startswith("Move_")]
+    area_columns = [column for column in games.columns if column.startswith("Area_")]
+    moves = games[move_columns].to_numpy()
+    if len(moves) > 0 and (moves.min() < 0 or moves.max() > np.iinfo(MOVE_DTYPE).max):
+        raise ValueError("Cell ids do not fit in {}".format(np.dtype(MOVE_DTYPE).name))
+
+    os.makedirs(store_path, exist_ok=True)
+    np.save(os.path.join(store_path, "moves.npy"), np.ascontiguousarray(moves.T, dtype=MOVE_DTYPE))
+    np.save(os.path.join(store_path, "areas.npy"), np.ascontiguousarray(games[area_columns].to_numpy().T, dtype=AREA_DTYPE))
+    manifest = {
+        "format": STORE_FORMAT,
+        "version": STORE_VERSION,
+        "num_games": len(games),
+        "columns": list(games.columns),
+        "moves": {"file": "moves.npy", "dtype": np.dtype(MOVE_DTYPE).name, "columns": move_columns},
+        "areas": {"file": "areas.npy", "dtype": np.dtype(AREA_DTYPE).name, "columns": area_columns},
+    }
+    if "Count" in games.columns:
+        np.save(os.path.join(store_path, "counts.npy"), games["Count"].to_numpy(dtype=COUNT_DTYPE))
+        manifest["counts"] = {"file": "counts.npy", "dtype": np.dtype(COUNT_DTYPE).name, "columns": ["Count"]}
+    with open(os.path.join(store_path, "manifest.json"), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return store_path
+
+def csv_to_store(csv_path, store_path=None):
+    """Convert a CSV dataset into a game store and return the store path."""
+    store_path = store_path or store_path_for(csv_path)
+    return dataframe_to_store(pd.read_csv(csv_path), store_path)
+
+def load_store(store_path, mmap=True):
+    """Open a game store as a DataFrame.
+
+    With mmap=True the columns are read-only views straight onto the
+    memory-mapped .npy files, so nothing is parsed or copied up front.
+    """
+    with open(os.path.join(store_path, "manifest.json")) as file:
+        manifest = json.load(file)
+    if manifest.get("format") != STORE_FORMAT or manifest.get("version") != STORE_VERSION:
+        raise ValueError("{} is not a version {} game store".format(store_path, STORE_VERSION))
+    mmap_mode = 'r' if mmap else None
+    data = {}
+    for part in ("moves", "areas"):
+        array = np.load(os.path.join(store_path, manifest[part]["file"]), mmap_mode=mmap_mode)
+        data.update(zip(manifest[part]["columns"], array))
+    if "counts" in manifest:
+        data["Count"] = np.load(os.path.join(store_path, manifest["counts"]["file"]), mmap_mode=mmap_mode)
+    return pd.DataFrame(data, columns=manifest["columns"], copy=False)
+
+def store_to_csv(store_path, csv_path):
+    """Write a game store back out in the CSV schema."""
+    load_store(store_path).to_csv(csv_path, index=False)
+
+def is_store(path):
+    """True if path holds a game store this version of the code can read."""
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.isfile(manifest_path):
+        return False
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    return manifest.get("format") == STORE_FORMAT and manifest.get("version") == STORE_VERSION
+
+def load_dataset(path, mmap=True):
+    """Load a dataset from a game store or a CSV.
+
+    A CSV path is served from its sibling .vgs store when one exists and is
+    at least as new as the CSV; otherwise the CSV is parsed with pandas.
+    """
+    if is_store(path):
+        return load_store(path, mmap)
+    store_path = store_path_for(path)
+    if is_store(store_path):
+        if not os.path.exists(path) or os.path.getmtime(os.path.join(store_path, "manifest.json")) >= os.path.getmtime(path):
+            return load_store(store_path, mmap)
+    return pd.read_csv(path)
+
+def ensure_store(path):
+    """Return the path of an up-to-date game store for a dataset path, converting the CSV if needed."""
+    if is_store(path):
+        return path
+    store_path = store_path_for(path)
+    if not is_store(store_path) or (os.path.exists(path) and os.path.getmtime(os.path.join(store_path, "manifest.json")) < os.path.getmtime(path)):
+        csv_to_store(path, store_path)
+    return store_path
+
+if __name__ == "__main__":
+    for name in sorted(os.listdir("datasets")):
+        if name.endswith(".csv"):
+            print(csv_to_store(os.path.join("datasets", name)))
@@ -0,0 +1,18 @@
+import numpy as np
+from datagen import state_gain_map
+
+def greedy_move(gain):
+    """Cell id with the highest gain, ties broken at random."""
+    best = np.flatnonzero(gain == gain.max())
+    return int(np.random.choice(best))
+
+def greedy_model(current_state:list, data=None, red_points=None, size=100, quarantine_distance=5):
+    """Play the legal cell that gains the most area right now.
+
+    Called like voronoi_knn.model; data and red_points are not needed.
+    """
+    return greedy_move(state_gain_map(current_state, size, quarantine_distance))
+
+def greedy_model_batch(states, data=None, red_points=None, size=100, quarantine_distance=5):
+    """greedy_model for a (G, t) array of states, usable as a lockstep policy."""
+    return np.array([greedy_model(state, size=size, quarantine_distance=quarantine_distance) for state in np.asarray(states)], dtype=np.int64)
@@ -4,6 +4,7 @@ import numpy as np
 from datagen import *
 import time
 from voronoi_knn import *
+from render import BoardRenderer
 
 # Initialize pygame
 pygame.init()
@@ -14,6 +15,8 @@ cell_size = 5
 width, height = size*cell_size, size*cell_size
 screen = pygame.display.set_mode((width, height))
 pygame.display.set_caption("Voronoi Game")
+renderer = BoardRenderer(screen, size, cell_size)
+clock = pygame.time.Clock()
 
 # Colors
 RED = (255, 0, 0)
@@ -22,46 +25,31 @@ BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
 def draw_grid(markers, red_points, blue_points, size=100):
-    for x in range(size):
-        for y in range(size):
-            rect = pygame.Rect(x*cell_size, y*cell_size, cell_size, cell_size)
-            if (x,y) in markers:
-                pygame.draw.rect(screen, BLACK, rect)
-            elif bool(red_points[x, y]) is True:
-                pygame.draw.rect(screen, RED, rect)
-            elif bool(blue_points[x, y]) is True:
-                pygame.draw.rect(screen, BLUE, rect)
-            # else:
-            #     pygame.draw.rect(screen, BLACK, rect)
-    pygame.display.update()
+    """Draw the board through the shared renderer, repainting only what changed."""
+    renderer.draw(markers, red_points, blue_points)
 
 def human_vs_ai(model, data, size=100, cell_size=5, num_turns=5, quarantine_distance=5, start="model"):
     """Simulate a game and return the final grid and outcome."""
     grid = initialize_grid(size)
     markers = []
     current_state = []
-    red_markers = []
-    blue_markers = []
+    ownership = VoronoiOwnership(size)
     player = 1 if start == "model" else 2
     moves = 0
+    renderer.invalidate()
 
     while moves < 2*num_turns:
-        screen.fill(BLACK)
         
         if player == 1:
             action = model(current_state=current_state, data=data)
             x, y = divmod(action, size)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+            if not is_valid_move(grid, x, y):
+                x, y = sample_legal_move(grid)
             
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            place_marker(grid, x, y, player)
+            place_marker(grid, x, y, player, quarantine_distance)
             markers.append((x,y))
             current_state.append(size*x+y)
-            red_markers.append((x,y))
+            ownership.place(x, y, player)
             moves += 1
             player = 2
         
@@ -73,18 +61,18 @@ def human_vs_ai(model, data, size=100, cell_size=5, num_turns=5, quarantine_dist
                     sys.exit()
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     x, y = pygame.mouse.get_pos()[0]//cell_size, pygame.mouse.get_pos()[1]//cell_size
-                    valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+                    valid_move = is_valid_move(grid, x, y)
                     if valid_move:
-                        place_marker(grid, x, y, player)
+                        place_marker(grid, x, y, player, quarantine_distance)
                         markers.append((x,y))
                         current_state.append(size*x+y)
-                        blue_markers.append((x,y))
+                        ownership.place(x, y, player)
                         moves += 1
                         player = 1
         
-        red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
+        red_points, blue_points = ownership.points()
         draw_grid(markers=markers, red_points=red_points, blue_points=blue_points, size=size)
-        pygame.display.flip()
+        clock.tick(60)
         red_percentage, blue_percentage = calculate_area_percentage(red_points, blue_points)
         
 
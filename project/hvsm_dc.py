@@ -1,9 +1,13 @@
 import pygame 
+import os
 import sys
 import numpy as np
 from datagen import *
 import time
 from voronoi_knn import *
+from rollout import RolloutPlayer
+from render import BoardRenderer
+from aimove import MoveRequest
 
 
 
@@ -13,72 +17,78 @@ BLUE = (0, 0, 255)
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
-def draw_grid(markers, red_points, blue_points, size=100):
-    for x in range(size):
-        for y in range(size):
-            rect = pygame.Rect(x*cell_size, y*cell_size, cell_size, cell_size)
-            if (x,y) in markers:
-                pygame.draw.rect(screen, BLACK, rect)
-            elif bool(red_points[x, y]) is True:
-                pygame.draw.rect(screen, RED, rect)
-            elif bool(blue_points[x, y]) is True:
-                pygame.draw.rect(screen, BLUE, rect)
-            # else:
-            #     pygame.draw.rect(screen, BLACK, rect)
-    pygame.display.update()
-
-def human_vs_ai(model, data, size=100, cell_size=10, num_turns=5, quarantine_distance=5, start="model"):
-    """Simulate a game and return the final grid and outcome."""
+def draw_grid(renderer, markers, red_points, blue_points):
+    """Draw the board through renderer, repainting only what changed."""
+    renderer.draw(markers, red_points, blue_points)
+
+def human_vs_ai(model, data, size=100, cell_size=10, num_turns=5, quarantine_distance=5, start="model", timeout=10):
+    """Simulate a game and return the final grid and outcome.
+
+    If the model takes longer than timeout seconds a random legal move is
+    played for it instead.
+    """
     grid = initialize_grid(size)
     markers = []
     current_state = []
-    red_markers = []
-    blue_markers = []
+    ownership = VoronoiOwnership(size)
     player = 1 if start == "model" else 2
     moves = 0
-    red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
+    red_points, blue_points = ownership.points()
+    renderer = BoardRenderer(pygame.display.get_surface(), size, cell_size)
+    clock = pygame.time.Clock()
+
+    request = None
 
     while moves < 2*num_turns:
-        screen.fill(BLACK)
-        
+        event_list = pygame.event.get()
+        if any(event.type == pygame.QUIT for event in event_list):
+            if request is not None:
+                request.cancel()
+            pygame.quit()
+            sys.exit()
+
         if player == 1:
-            action = model(current_state=current_state, data=data, red_points=red_points)
-            x, y = divmod(action, size)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            print(x, y)
-            place_marker(grid, x, y, player)
-            markers.append((x,y))
-            current_state.append(size*x+y)
-            red_markers.append((x,y))
-            moves += 1
-            player = 2
-        
+            # The model runs on a background thread so the window stays live
+            if request is None:
+                request = MoveRequest(model, current_state, data, red_points, timeout=timeout)
+            if not request.done():
+                pygame.display.set_caption(f"Voronoi Game - AI thinking ({request.elapsed():.0f}s)")
+            else:
+                action = request.result()
+                request = None
+                pygame.display.set_caption("Voronoi Game")
+                if action is None:
+                    x, y = sample_legal_move(grid)
+                else:
+                    x, y = divmod(int(action), size)
+                    if not is_valid_move(grid, x, y):
+                        x, y = sample_legal_move(grid)
+
+                print(x, y)
+                place_marker(grid, x, y, player, quarantine_distance)
+                markers.append((x,y))
+                current_state.append(size*x+y)
+                ownership.place(x, y, player)
+                moves += 1
+                player = 2
+
         else:
-            event_list = pygame.event.get()
             for event in event_list:
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.type == pygame.MOUSEBUTTONDOWN:
                     x, y = pygame.mouse.get_pos()[0]//cell_size, pygame.mouse.get_pos()[1]//cell_size
-                    valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+                    valid_move = is_valid_move(grid, x, y)
                     if valid_move:
-                        place_marker(grid, x, y, player)
+                        place_marker(grid, x, y, player, quarantine_distance)
                         markers.append((x,y))
                         current_state.append(size*x+y)
-                        blue_markers.append((x,y))
+                        ownership.place(x, y, player)
                         moves += 1
                         player = 1
-        
-        red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
-        draw_grid(markers=markers, red_points=red_points, blue_points=blue_points, size=size)
-        pygame.display.flip()
+                        break
+
+        red_points, blue_points = ownership.points()
+        draw_grid(renderer, markers=markers, red_points=red_points, blue_points=blue_points)
+        clock.tick(60)
         red_percentage, blue_percentage = calculate_area_percentage(red_points, blue_points)
         
 
@@ -94,7 +104,11 @@ def human_vs_ai(model, data, size=100, cell_size=10, num_turns=5, quarantine_dis
     else:
         return outcome, red_percentage, blue_percentage, current_state + [blue_percentage, red_percentage]
 
-def game():
+def game(model=model):
+    # Loaded once for the session from the prebuilt snapshot; games played
+    # now are appended to the CSV and picked up when the snapshot is rebuilt
+    # at the start of the next session.
+    data = load_snapshot("datasets/combined.csv")
     while True:
         # Initialize pygame
         pygame.init()
@@ -113,7 +127,6 @@ def game():
         new_data = []
 
         if n == str(1):
-            data = pd.read_csv(f"datasets/combined.csv")
             screen = pygame.display.set_mode((width, height))
             pygame.display.set_caption("Voronoi Game")
 
@@ -127,7 +140,6 @@ def game():
             dataset.to_csv("datasets/combined.csv", mode='a', index=False, header=False)
 
         elif n == str(2):
-            data = pd.read_csv(f"datasets/combined.csv")
             screen = pygame.display.set_mode((width, height))
             pygame.display.set_caption("Voronoi Game")
             outcome, ai, human, game_data = human_vs_ai(model=model, data=data, size=size, cell_size=cell_size, start="model")
@@ -145,5 +157,9 @@ def game():
 
 
 if __name__ == "__main__":
-    game()
+    # --rollout plays the Monte Carlo player instead of KNN
+    if "--rollout" in sys.argv:
+        game(RolloutPlayer(workers=os.cpu_count()))
+    else:
+        game()
 
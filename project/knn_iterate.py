@@ -6,47 +6,48 @@ from tqdm import tqdm
 from datagen import *
 from voronoi_knn import *
 import time
+from gamestore import load_dataset
+from profiling import profiler
+from gamelog import GameLogWriter
 
-def model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, start="model"):
+def model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, start="model", rejection_sampling=False):
     """Simulate a game and return the final grid and outcome."""
     grid = initialize_grid(size)
+    ownership = VoronoiOwnership(size)
     markers = []
-    red_markers = []
-    blue_markers = []
     player = 1 if start == "model" else 2 
 
     for _ in range(num_turns * 2):
         
         if player == 1:
-            action = model(current_state=markers, data=data)
+            with profiler.phase("model"):
+                action = model(current_state=markers, data=data)
             x, y = divmod(action, size)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+            with profiler.phase("validity"):
+                valid = is_valid_move(grid, x, y)
+            if not valid:
+                profiler.count("model_fallbacks")
+                with profiler.phase("sampling"):
+                    x, y = sample_legal_move(grid, rejection_sampling)
             
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            place_marker(grid, x, y, player)
+            place_marker(grid, x, y, player, quarantine_distance)
+            with profiler.phase("scoring"):
+                ownership.place(x, y, player)
             markers.append(size*x+y)
-            red_markers.append((x,y))
         
         else:
-            valid_move = False
-            
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+            with profiler.phase("sampling"):
+                x, y = sample_legal_move(grid, rejection_sampling)
             
-            place_marker(grid, x, y, player)
+            place_marker(grid, x, y, player, quarantine_distance)
+            with profiler.phase("scoring"):
+                ownership.place(x, y, player)
             markers.append(size*x+y)
-            blue_markers.append((x,y))
 
         player = 2 if player == 1 else 1  # Switch player
 
-    red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
-    red_percentage, blue_percentage = calculate_area_percentage(red_points, blue_points)
+    with profiler.phase("scoring"):
+        red_percentage, blue_percentage = ownership.area_percentage()
 
     if red_percentage > blue_percentage:
         outcome = "model wins"  # Red player wins
@@ -57,34 +58,58 @@ def model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, s
 
     return outcome, markers + [red_percentage, blue_percentage]
 
-def simulate_model_vs_random(model, data, name_to_save, num_games=100, size=100, num_turns=5, quarantine_distance=5, start="model"):
-    win_count = 0
+def simulate_model_vs_random(model, data, name_to_save, num_games=100, size=100, num_turns=5, quarantine_distance=5, start="model", rejection_sampling=False, chunk_size=500, resume=False, stats_path=None):
+    """Play num_games games, streaming rows to name_to_save every chunk_size games.
+
+    With resume=True a run interrupted part way through continues from its
+    last checkpointed chunk instead of starting over. With stats_path set
+    the run is profiled and its phase timings appended there as a JSON line.
+    """
+    if stats_path is not None:
+        profiler.enable()
     columns = ['Move_{}_P{}'.format(i + 1, 1 + i % 2) for i in range(2 * num_turns)] + ['Area_P1', 'Area_P2']
-    new_data = []
-    for _ in tqdm(range(num_games), desc="Games Played"):
-        outcome, game_data = model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, start="model")
-        new_data.append(game_data)
+    writer = GameLogWriter(name_to_save, columns, chunk_size, resume)
+    first_game = writer.games
+    for _ in tqdm(range(writer.games, num_games), desc="Games Played", initial=writer.games, total=num_games):
+        outcome, game_data = model_vs_random(model, data, size=size, num_turns=num_turns, quarantine_distance=quarantine_distance, start="model", rejection_sampling=rejection_sampling)
+        with profiler.phase("io"):
+            writer.append(game_data, outcome)
+    with profiler.phase("io"):
+        writer.close()
+    if stats_path is not None:
+        profiler.write(stats_path, games=num_games - first_game, driver="knn_iterate", name_to_save=name_to_save)
+        profiler.disable()
+
+    win_count = writer.counts.get("model wins", 0)
+    win_percentage = (win_count/num_games)*100
+    return win_percentage
 
-        # print(outcome)
-        if outcome == "model wins":
-            win_count += 1
-    
-    dataset = pd.DataFrame(new_data, columns=columns)
+def simulate_model_vs_random_lockstep(model_batch, data, name_to_save, num_games=100, size=100, num_turns=5, quarantine_distance=5, seed=None):
+    """simulate_model_vs_random with every game advanced in lockstep and one model call per ply."""
+    policies = {1: lambda states: model_batch(states, data)}
+    moves = play_games_lockstep(num_games, size, num_turns, quarantine_distance, np.random.default_rng(seed), policies)
+    red_percentage, blue_percentage = score_moves(moves, size)
+    win_count = int(np.sum(red_percentage > blue_percentage))
+
+    columns = ['Move_{}_P{}'.format(i + 1, 1 + i % 2) for i in range(2 * num_turns)] + ['Area_P1', 'Area_P2']
+    dataset = pd.DataFrame(moves, columns=columns[:-2])
+    dataset['Area_P1'], dataset['Area_P2'] = red_percentage, blue_percentage
     dataset.to_csv(name_to_save, index=False)
     win_percentage = (win_count/num_games)*100
     return win_percentage
 
 if __name__ == "__main__":
     iterations = 10
-    data = pd.read_csv("voronoi_data.csv")
+    data = load_dataset("voronoi_data.csv")
     for i in range(iterations):
         print(f"Iteration: {i+1}")
         name = f"knn_data2_{i+1}.csv"
         tic = time.localtime()
         # print(tic)
-        win_percentage = simulate_model_vs_random(model=model, data=data, name_to_save=name, num_games=10000, start="random")
+        win_percentage = simulate_model_vs_random(model=model, data=data, name_to_save=name, num_games=10000, start="random", resume=True, stats_path="stats.jsonl")
+        print(f"Prefix table: {get_model(data).prefix_stats()}")
         toc = time.localtime()
         with open("record.txt", 'a') as file:
             file.write(f"iteration: {i}, start time: {tic}, end time: {toc}\n")
-        data = pd.read_csv(name)
+        data = load_dataset(name)
         print(f"Win Percentage: {win_percentage}%")
@@ -0,0 +1,178 @@
+import os
+import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import datagen
+import knn_iterate
+import ai_vs_ai
+from gamestore import ensure_store, load_store
+from voronoi_knn import share_model, attach_model
+
+# Datasets a worker process attached to, keyed by store path
+_shared = {}
+
+def split_games(num_games, workers):
+    """Split num_games into one near-equal share per worker."""
+    share, extra = divmod(num_games, workers)
+    return [share + (1 if k < extra else 0) for k in range(workers)]
+
+def worker_seeds(seed, workers):
+    """Independent, reproducible seeds for each worker derived from one seed."""
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(workers)]
+
+def seed_worker(seed):
+    """Seed both random sources the game engine and the model draw from."""
+    random.seed(seed)
+    np.random.seed(seed)
+
+def share_dataset(path, num_turns=5):
+    """Prepare a dataset for zero-copy use by workers.
+
+    Makes sure the dataset has an up-to-date game store and a prebuilt KNN
+    model for every ply next to it, both built at most once, and returns
+    (store path, model path) for attach_dataset.
+    """
+    store_path = ensure_store(path)
+    return store_path, share_model(store_path, range(2 * num_turns))
+
+def attach_dataset(*shared):
+    """Worker initializer: memory-map each (store path, model path) pair read-only.
+
+    Nothing is parsed or fitted, so a worker is ready in milliseconds and
+    all workers share one copy of the data through the page cache.
+    """
+    for store_path, index_path in shared:
+        data = load_store(store_path)
+        attach_model(data, index_path)
+        _shared[store_path] = data
+
+def shared_data(data):
+    """The attached DataFrame for a store path, or data itself if it is already a DataFrame."""
+    return _shared[data] if isinstance(data, str) else data
+
+def shard_name(name_to_save, k):
+    """Path of the k-th shard written next to name_to_save."""
+    root, ext = os.path.splitext(name_to_save)
+    return f"{root}.shard{k}{ext}"
+
+def merge_shards(shard_paths, name_to_save):
+    """Concatenate CSV shards into name_to_save, keeping only the first header."""
+    with open(name_to_save, 'w') as out:
+        for k, path in enumerate(shard_paths):
+            with open(path) as shard:
+                header = shard.readline()
+                if k == 0:
+                    out.write(header)
+                shutil.copyfileobj(shard, out)
+
+def _columns(num_turns):
+    return ['Move_{}_P{}'.format(i + 1, 1 + i % 2) for i in range(2 * num_turns)] + ['Area_P1', 'Area_P2']
+
+def _model_vs_random_shard(model, data, shard, num_games, seed, kwargs):
+    seed_worker(seed)
+    data = shared_data(data)
+    win_count = 0
+    new_data = []
+    for _ in range(num_games):
+        outcome, game_data = knn_iterate.model_vs_random(model, data, **kwargs)
+        new_data.append(game_data)
+        if outcome == "model wins":
+            win_count += 1
+    pd.DataFrame(new_data, columns=_columns(kwargs["num_turns"])).to_csv(shard, index=False)
+    return win_count
+
+def _ai_vs_ai_shard(model, data1, data2, shard, num_games, seed, kwargs):
+    seed_worker(seed)
+    data1, data2 = shared_data(data1), shared_data(data2)
+    model1 = 0
+    model2 = 0
+    new_data = []
+    for _ in range(num_games):
+        outcome, game_data = ai_vs_ai.model_vs_random(model, data1, data2, **kwargs)
+        new_data.append(game_data)
+        if outcome == "red wins":
+            model1 += 1
+        elif outcome == "blue wins":
+            model2 += 1
+    pd.DataFrame(new_data, columns=_columns(kwargs["num_turns"])).to_csv(shard, index=False)
+    return model1, model2
+
+def _dataset_shard(shard, num_games, seed, kwargs):
+    seed_worker(seed)
+    dataset = datagen.generate_dataset(num_games, seed=seed, **kwargs)
+    dataset.to_csv(shard, index=False)
+    return len(dataset)
+
+def _run(task, args, name_to_save, num_games, workers, seed, kwargs, shared=()):
+    """Run task on a process pool, one shard per worker, and merge the shards into name_to_save.
+
+    The number of workers is capped at num_games so no shard is empty, and
+    the shard files are removed whether or not the run succeeds. shared
+    lists the (store path, model path) pairs every worker attaches to on
+    start. Returns the task results in shard order.
+    """
+    workers = max(1, min(workers or os.cpu_count(), num_games))
+    shards = [shard_name(name_to_save, k) for k in range(workers)]
+    shares = split_games(num_games, workers)
+    seeds = worker_seeds(seed, workers)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=attach_dataset, initargs=tuple(shared)) as pool:
+            futures = [pool.submit(task, *args, shards[k], shares[k], seeds[k], kwargs) for k in range(workers)]
+            results = [future.result() for future in tqdm(futures, desc="Shards finished")]
+        merge_shards(shards, name_to_save)
+        return results
+    finally:
+        for path in shards:
+            if os.path.exists(path):
+                os.remove(path)
+
+def simulate_model_vs_random_parallel(model, data, name_to_save, num_games=100, workers=None, seed=None, size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False):
+    """Parallel knn_iterate.simulate_model_vs_random, one shard and seed per worker.
+
+    data is a DataFrame, sent to every worker, or a dataset path, which the
+    workers memory-map together with a KNN model prebuilt once (see
+    share_dataset).
+    """
+    shared = []
+    if isinstance(data, str):
+        shared.append(share_dataset(data, num_turns))
+        data = shared[0][0]
+    kwargs = dict(size=size, num_turns=num_turns, quarantine_distance=quarantine_distance, start="model", rejection_sampling=rejection_sampling)
+    wins = _run(_model_vs_random_shard, (model, data), name_to_save, num_games, workers, seed, kwargs, shared)
+    win_percentage = (sum(wins)/num_games)*100
+    return win_percentage
+
+def simulate_ai_vs_ai_parallel(model, data1, data2, name_to_save, num_games=10000, workers=None, seed=None, size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False):
+    """Parallel ai_vs_ai.simulate_ai_vs_ai, one shard and seed per worker.
+
+    data1 and data2 are DataFrames or dataset paths, as in
+    simulate_model_vs_random_parallel.
+    """
+    shared = {}
+    for data in (data1, data2):
+        if isinstance(data, str) and data not in shared:
+            shared[data] = share_dataset(data, num_turns)
+    data1, data2 = [shared[data][0] if isinstance(data, str) else data for data in (data1, data2)]
+    kwargs = dict(size=size, num_turns=num_turns, quarantine_distance=quarantine_distance, rejection_sampling=rejection_sampling)
+    counts = _run(_ai_vs_ai_shard, (model, data1, data2), name_to_save, num_games, workers, seed, kwargs, shared.values())
+    model1 = sum(c[0] for c in counts)
+    model2 = sum(c[1] for c in counts)
+    model1_percentage = (model1/num_games)*100
+    model2_percentage = (model2/num_games)*100
+    tie_percentage = ((num_games-model1-model2)/num_games)*100
+    return model1_percentage, model2_percentage, tie_percentage
+
+def generate_dataset_parallel(num_games, name_to_save, workers=None, seed=None, size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False, lockstep=False):
+    """Parallel datagen.generate_dataset, merged into name_to_save and returned."""
+    kwargs = dict(size=size, num_turns=num_turns, quarantine_distance=quarantine_distance, rejection_sampling=rejection_sampling, lockstep=lockstep)
+    _run(_dataset_shard, (), name_to_save, num_games, workers, seed, kwargs)
+    return pd.read_csv(name_to_save)
+
+if __name__ == "__main__":
+    from voronoi_knn import model
+
+    win_percentage = simulate_model_vs_random_parallel(model=model, data="datasets/voronoi_data.csv", name_to_save="datasets/knn_parallel.csv", num_games=10000, seed=0)
+    print(f"Win Percentage: {win_percentage}%")
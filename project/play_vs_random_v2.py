@@ -5,47 +5,47 @@ import pandas as pd
 from tqdm import tqdm
 from datagen import *
 from voronoi_knn import *
+from gamestore import load_dataset
+from profiling import profiler
 
-def model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, start="model"):
+def model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, start="model", rejection_sampling=False):
     """Simulate a game and return the final grid and outcome."""
     grid = initialize_grid(size)
+    ownership = VoronoiOwnership(size)
     markers = []
-    red_markers = []
-    blue_markers = []
     player = 1 if start == "model" else 2 
 
     for _ in range(num_turns * 2):
         
         if player == 1:
-            action = model(markers, data)
+            with profiler.phase("model"):
+                action = model(markers, data)
             x, y = divmod(action, size)
-            valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+            with profiler.phase("validity"):
+                valid = is_valid_move(grid, x, y)
+            if not valid:
+                profiler.count("model_fallbacks")
+                with profiler.phase("sampling"):
+                    x, y = sample_legal_move(grid, rejection_sampling)
             
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
-            
-            place_marker(grid, x, y, player)
+            place_marker(grid, x, y, player, quarantine_distance)
+            with profiler.phase("scoring"):
+                ownership.place(x, y, player)
             markers.append(size*x+y)
-            red_markers.append((x,y))
         
         else:
-            valid_move = False
-            
-            while not valid_move:
-                x = random.randint(0, size - 1)
-                y = random.randint(0, size - 1)
-                valid_move = is_valid_move(grid, x, y, quarantine_distance, player)
+            with profiler.phase("sampling"):
+                x, y = sample_legal_move(grid, rejection_sampling)
             
-            place_marker(grid, x, y, player)
+            place_marker(grid, x, y, player, quarantine_distance)
+            with profiler.phase("scoring"):
+                ownership.place(x, y, player)
             markers.append(size*x+y)
-            blue_markers.append((x,y))
 
         player = 2 if player == 1 else 1  # Switch player
 
-    red_points, blue_points = calculate_voronoi_points(grid, red_markers, blue_markers)
-    red_percentage, blue_percentage = calculate_area_percentage(red_points, blue_points)
+    with profiler.phase("scoring"):
+        red_percentage, blue_percentage = ownership.area_percentage()
 
     if red_percentage > blue_percentage:
         outcome = "model wins"  # Red player wins
@@ -56,19 +56,25 @@ def model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, s
 
     return outcome, red_percentage, blue_percentage
 
-def simulate_model_vs_random(model, data, num_games=100, size=100, num_turns=5, quarantine_distance=5, start="model"):
+def simulate_model_vs_random(model, data, num_games=100, size=100, num_turns=5, quarantine_distance=5, start="model", rejection_sampling=False, stats_path=None):
+    """Play num_games games and return the win percentage, profiled into stats_path if given."""
+    if stats_path is not None:
+        profiler.enable()
     win_count = 0
     for _ in tqdm(range(num_games), desc="Games Played"):
-        outcome, red_percentage, blue_percentage = model_vs_random(model, data, size=100, num_turns=5, quarantine_distance=5, start="model")
+        outcome, red_percentage, blue_percentage = model_vs_random(model, data, size=size, num_turns=num_turns, quarantine_distance=quarantine_distance, start="model", rejection_sampling=rejection_sampling)
 
         # print(outcome)
         if outcome == "model wins":
             win_count += 1
     
+    if stats_path is not None:
+        profiler.write(stats_path, games=num_games, driver="play_vs_random_v2")
+        profiler.disable()
     win_percentage = (win_count/num_games)*100
     return win_percentage
 
 if __name__ == "__main__":
-    data = pd.read_csv("voronoi_data.csv")
+    data = load_dataset("voronoi_data.csv")
     win_percentage = simulate_model_vs_random(model=model, data=data, num_games=1000)
     print(f"Win Percentage based on area controlled: {win_percentage}%")
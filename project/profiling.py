@@ -0,0 +1,127 @@
+import json
+import math
+import threading
+import time
+
+class NullPhase:
+    """Context manager that does nothing, handed out while profiling is off."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = NullPhase()
+
+class Phase:
+    """One timed `with` block. Time spent in phases nested inside it is not its own."""
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        self.nested = 0.0
+
+    def __enter__(self):
+        self.profiler.stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        stack = self.profiler.stack()
+        stack.pop()
+        if stack:
+            stack[-1].nested += seconds
+        self.profiler.record(self.name, seconds, seconds - self.nested)
+        return False
+
+class Profiler:
+    """Phase timers, event counters and duration histograms for the simulation drivers.
+
+    Code marks its phases with `with profiler.phase("model"):` and events
+    with profiler.count(...). While disabled, phase() returns a shared no-op
+    context manager and count() returns at once, so instrumented code costs
+    a method call per phase. Phases may nest, e.g. index_fit inside model:
+    each thread keeps its own stack of open phases, a phase's total is its
+    exclusive time (nested phases subtracted) and its inclusive time is
+    reported separately, so the shares of one thread sum to at most 1.
+    Durations of whole calls go into log2 buckets of microseconds, and
+    write() appends one JSON line per run with totals, counts, histograms
+    and games per second.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        self.totals = {}
+        self.inclusive = {}
+        self.calls = {}
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self.reset()
+
+    def disable(self):
+        self.enabled = False
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def stack(self):
+        """The open phases of the calling thread, innermost last."""
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def record(self, name, seconds, exclusive=None):
+        exclusive = seconds if exclusive is None else exclusive
+        bucket = max(0, math.ceil(math.log2(max(seconds * 1e6, 1))))
+        with self.lock:
+            self.totals[name] = self.totals.get(name, 0.0) + exclusive
+            self.inclusive[name] = self.inclusive.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+            histogram = self.histograms.setdefault(name, {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def stats(self, games=None, **extra):
+        """Everything recorded since the last reset as a JSON-ready dict."""
+        elapsed = time.perf_counter() - self.started
+        stats = dict(extra)
+        stats["elapsed"] = elapsed
+        if games is not None:
+            stats["games"] = games
+            stats["games_per_sec"] = games / elapsed if elapsed > 0 else None
+        stats["phases"] = {
+            name: {
+                "total": self.totals[name],
+                "inclusive": self.inclusive[name],
+                "calls": self.calls[name],
+                "share": self.totals[name] / elapsed if elapsed > 0 else None,
+                # Upper bound of each bucket in microseconds -> number of calls
+                "histogram_us": {str(2**bucket): count for bucket, count in sorted(self.histograms[name].items())},
+            }
+            for name in self.totals
+        }
+        stats["counters"] = dict(self.counters)
+        return stats
+
+    def write(self, path, games=None, **extra):
+        """Append the current stats to path as one JSON line and start a new run."""
+        with open(path, 'a') as file:
+            file.write(json.dumps(self.stats(games, **extra)) + "\n")
+        self.reset()
+
+profiler = Profiler()
@@ -0,0 +1,58 @@
+import numpy as np
+import pygame
+
+BLACK = (0, 0, 0)
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+# Cell labels used to index the palette
+EMPTY, RED_CELL, BLUE_CELL, MARKER = 0, 1, 2, 3
+
+class BoardRenderer:
+    """Draw the board as one scaled image instead of a rect per cell.
+
+    Every frame the cells are labelled in a (size, size) array, indexed
+    [x, y] like the grid and pygame's surfarray. Only the bounding box of
+    the cells whose label changed since the last draw is scaled, blitted and
+    pushed to the display, and nothing at all is drawn if the board is
+    unchanged, so waiting for a click costs next to nothing.
+    """
+    def __init__(self, screen, size, cell_size, colors=(BLACK, RED, BLUE, BLACK)):
+        self.screen = screen
+        self.size = size
+        self.cell_size = cell_size
+        self.palette = np.array(colors, dtype=np.uint8)
+        self.board = pygame.Surface((size, size))
+        self.labels = None
+
+    def invalidate(self):
+        """Force the next draw to repaint the whole board, e.g. after the screen was cleared."""
+        self.labels = None
+
+    def draw(self, markers, red_points, blue_points):
+        """Redraw the cells that changed and return the dirty screen rect, or None."""
+        labels = np.zeros((self.size, self.size), dtype=np.uint8)
+        labels[red_points] = RED_CELL
+        labels[blue_points] = BLUE_CELL
+        if len(markers) > 0:
+            x, y = np.asarray(markers).reshape(-1, 2).T
+            labels[x, y] = MARKER
+
+        if self.labels is None:
+            x0, y0, x1, y1 = 0, 0, self.size, self.size
+        else:
+            changed = labels != self.labels
+            if not changed.any():
+                return None
+            xs = np.flatnonzero(changed.any(axis=1))
+            ys = np.flatnonzero(changed.any(axis=0))
+            x0, x1, y0, y1 = xs[0], xs[-1] + 1, ys[0], ys[-1] + 1
+        self.labels = labels
+
+        pygame.surfarray.blit_array(self.board, self.palette[labels])
+        region = self.board.subsurface((x0, y0, x1 - x0, y1 - y0))
+        c = self.cell_size
+        dirty = pygame.Rect(x0 * c, y0 * c, (x1 - x0) * c, (y1 - y0) * c)
+        self.screen.blit(pygame.transform.scale(region, dirty.size), dirty.topleft)
+        pygame.display.update(dirty)
+        return dirty
@@ -0,0 +1,122 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from datagen import play_games_lockstep, score_moves, stamp_quarantine
+
+# Policy and dataset of a worker process, set once by _init_worker
+_worker = {}
+
+def _init_worker(policy, data):
+    _worker["policy"] = policy
+    _worker["data"] = data
+
+def run_playouts(state, candidates, playouts, size=100, num_turns=5, quarantine_distance=5, rng=None, policy=None, data=None):
+    """Play the game out from state after each candidate move and total the results.
+
+    Each candidate is followed by playouts games played in lockstep to the
+    end, random or guided by policy (a batch model such as
+    voronoi_knn.model_batch, called as policy(states, data)), and scored with
+    score_moves. Returns, per candidate, the summed area margin of the player
+    to move at state.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    candidates = np.asarray(candidates, dtype=np.int64)
+    openings = np.column_stack([np.tile(np.asarray(state, dtype=np.int64), (len(candidates), 1)), candidates])
+    start_moves = np.repeat(openings, playouts, axis=0)
+    policies = None
+    if policy is not None:
+        guided = lambda moves: policy(moves, data)
+        policies = {1: guided, 2: guided}
+    moves = play_games_lockstep(len(start_moves), size, num_turns, quarantine_distance, rng, policies, start_moves)
+    area_p1, area_p2 = score_moves(moves, size)
+    margin = area_p1 - area_p2 if len(state) % 2 == 0 else area_p2 - area_p1
+    return margin.reshape(len(candidates), playouts).sum(axis=1)
+
+def _playout_task(state, candidates, playouts, size, num_turns, quarantine_distance, seed):
+    return run_playouts(state, candidates, playouts, size, num_turns, quarantine_distance, np.random.default_rng(seed), _worker.get("policy"), _worker.get("data"))
+
+class RolloutPlayer:
+    """Monte Carlo player choosing the candidate move with the best playout results.
+
+    Called like voronoi_knn.model, with the moves played so far, and returns
+    a cell id. A sample of num_candidates legal cells is evaluated in rounds
+    of playouts games per candidate until time_budget seconds have passed;
+    with workers > 1 every round runs one batch on each worker process. The
+    dataset is only used when a policy guides the playouts.
+    """
+    def __init__(self, size=100, num_turns=5, quarantine_distance=5, time_budget=1.0, num_candidates=24, playouts=16, workers=1, policy=None, seed=None):
+        self.size = size
+        self.num_turns = num_turns
+        self.quarantine_distance = quarantine_distance
+        self.time_budget = time_budget
+        self.num_candidates = num_candidates
+        self.playouts = playouts
+        self.workers = workers
+        self.policy = policy
+        self.rng = np.random.default_rng(seed)
+        self.pool = None
+        self.pool_data = None
+        self.rounds = 0
+
+    def candidates(self, state, data=None):
+        """Distinct legal cells to evaluate, including the policy's own pick if legal."""
+        mask = np.zeros((1, self.size, self.size), dtype=bool)
+        for cell in state:
+            x, y = divmod(int(cell), self.size)
+            stamp_quarantine(mask, [x], [y], self.quarantine_distance)
+        legal = np.flatnonzero(~mask[0])
+        if len(legal) == 0:
+            raise ValueError("No legal moves left on the board")
+        candidates = self.rng.choice(legal, size=min(self.num_candidates, len(legal)), replace=False)
+        if self.policy is not None:
+            proposal = int(self.policy(np.array([state], dtype=np.int64).reshape(1, -1), data)[0])
+            if 0 <= proposal < mask[0].size and not mask[0].flat[proposal] and proposal not in candidates:
+                candidates[0] = proposal
+        return candidates
+
+    def get_pool(self, data):
+        """Worker pool holding the policy and data, restarted if the data changes."""
+        if self.pool is None or self.pool_data is not data:
+            self.close()
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.policy, data))
+            self.pool_data = data
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+            self.pool_data = None
+
+    def __call__(self, current_state, data=None, red_points=None):
+        state = [int(cell) for cell in current_state]
+        candidates = self.candidates(state, data)
+        settings = (self.size, self.num_turns, self.quarantine_distance)
+        if len(state) + 1 >= 2 * self.num_turns:
+            # Last move: one playout per candidate is already the exact score
+            totals = run_playouts(state, candidates, 1, *settings)
+            return int(candidates[np.argmax(totals)])
+
+        totals = np.zeros(len(candidates))
+        deadline = time.perf_counter() + self.time_budget
+        self.rounds = 0
+        while True:
+            if self.workers > 1:
+                pool = self.get_pool(data)
+                seeds = self.rng.integers(2**63, size=self.workers)
+                futures = [pool.submit(_playout_task, state, candidates, self.playouts, *settings, seed) for seed in seeds]
+                for future in futures:
+                    totals += future.result()
+            else:
+                totals += run_playouts(state, candidates, self.playouts, *settings, self.rng, self.policy, data)
+            self.rounds += 1
+            if time.perf_counter() >= deadline:
+                break
+        return int(candidates[np.argmax(totals)])
+
+default_player = RolloutPlayer()
+
+def rollout_model(current_state:list, data=None, red_points=None):
+    """Drop-in replacement for voronoi_knn.model backed by default_player."""
+    return default_player(current_state, data, red_points)
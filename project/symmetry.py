@@ -0,0 +1,47 @@
+import numpy as np
+
+# The eight symmetries of the square board, with n = size - 1. Transform k
+# maps (x, y) to (c[X_SOURCE[k]], c[Y_SOURCE[k]]) where c = (x, y, n - x, n - y):
+# identity, the three rotations, transpose, the two flips, anti-transpose.
+# Index 0 is the identity and INVERSE[k] undoes transform k.
+NUM_TRANSFORMS = 8
+X_SOURCE = np.array([0, 1, 2, 3, 1, 2, 0, 3])
+Y_SOURCE = np.array([1, 2, 3, 0, 0, 1, 3, 2])
+INVERSE = np.array([0, 3, 2, 1, 4, 5, 6, 7])
+
+def transform_xy(x, y, k, n):
+    """Apply transform k (scalar or array broadcasting with x, y) to coordinates."""
+    k = np.asarray(k)
+    sources = [x, y, n - x, n - y]
+    return np.choose(X_SOURCE[k], sources), np.choose(Y_SOURCE[k], sources)
+
+def transform_cells(cells, k, size):
+    """Apply transform k to cell ids; k broadcasts against cells."""
+    x, y = np.divmod(np.asarray(cells), size)
+    tx, ty = transform_xy(x, y, k, size - 1)
+    return tx * size + ty
+
+def canonical_transforms(prefixes, size):
+    """Pick, per row, the transform giving the lexicographically smallest prefix.
+
+    Ties, which only happen for prefixes that are themselves symmetric, go to
+    the lowest transform index so data and queries always agree.
+    """
+    prefixes = np.asarray(prefixes)
+    num_rows, t = prefixes.shape
+    images = np.stack([transform_cells(prefixes, k, size) for k in range(NUM_TRANSFORMS)])
+    best = np.ones((NUM_TRANSFORMS, num_rows), dtype=bool)
+    for i in range(t):
+        column = np.where(best, images[:, :, i], np.iinfo(images.dtype).max)
+        best &= column == column.min(axis=0)
+    return best.argmax(axis=0)
+
+def canonicalize(prefixes, size):
+    """Map each row of move prefixes to its canonical orientation.
+
+    Returns the canonical prefixes and the transform used per row; moves in
+    the canonical frame go back with transform_cells(moves, INVERSE[k], size).
+    """
+    prefixes = np.asarray(prefixes)
+    k = canonical_transforms(prefixes, size)
+    return transform_cells(prefixes, k[:, np.newaxis], size), k
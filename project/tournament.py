@@ -0,0 +1,150 @@
+import argparse
+import importlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from tqdm import tqdm
+import ai_vs_ai
+from parallel import worker_seeds, seed_worker, share_dataset, attach_dataset, shared_data
+
+# Agents of a worker process, loaded once by _init_worker
+_agents = []
+
+def parse_agent(spec):
+    """Parse an agent spec "[name=]dataset[:module.function]" into (name, dataset, model)."""
+    name, _, rest = spec.rpartition("=")
+    dataset, _, model_name = rest.partition(":")
+    name = name or os.path.splitext(os.path.basename(dataset))[0]
+    return name, dataset, model_name or "voronoi_knn.model"
+
+def resolve_model(model_name):
+    """Import a model function from its dotted name, e.g. voronoi_knn.model."""
+    module, _, function = model_name.rpartition(".")
+    return getattr(importlib.import_module(module), function)
+
+def _init_worker(agents, shared):
+    # Each dataset is memory-mapped once per worker and shared by every pairing it plays
+    attach_dataset(*shared.values())
+    for name, dataset, model_name in agents:
+        _agents.append((shared_data(shared[dataset][0]), resolve_model(model_name)))
+
+def _play_pairing(red, blue, num_games, seed, kwargs):
+    """Play num_games with agent red moving first against agent blue; return (red wins, blue wins)."""
+    seed_worker(seed)
+    data1, model1 = _agents[red]
+    data2, model2 = _agents[blue]
+    red_wins = blue_wins = 0
+    for _ in range(num_games):
+        outcome, _ = ai_vs_ai.model_vs_random(model1, data1, data2, model2=model2, **kwargs)
+        if outcome == "red wins":
+            red_wins += 1
+        elif outcome == "blue wins":
+            blue_wins += 1
+    return red_wins, blue_wins
+
+def bradley_terry(wins, ties, iterations=1000, tolerance=1e-10):
+    """Bradley-Terry strengths from a win matrix, ties counting half a win to each side.
+
+    wins[i, j] is how often i beat j. Returns strengths normalised to a
+    geometric mean of 1, fitted with the standard MM updates.
+    """
+    score = wins + ties / 2
+    games = score + score.T
+    strength = np.ones(len(wins))
+    for _ in range(iterations):
+        pair = games / (strength[:, np.newaxis] + strength[np.newaxis, :])
+        np.fill_diagonal(pair, 0)
+        # Half a win and half a loss against a virtual average player keeps unbeaten agents finite
+        updated = (score.sum(axis=1) + 0.5) / (pair.sum(axis=1) + 1 / (strength + 1))
+        updated /= np.exp(np.mean(np.log(updated)))
+        done = np.max(np.abs(updated - strength)) < tolerance
+        strength = updated
+        if done:
+            break
+    return strength
+
+def elo_ratings(strength, base=1500):
+    """Convert Bradley-Terry strengths to the Elo scale."""
+    return base + 400 * np.log10(strength)
+
+def run_tournament(agents, num_games=100, workers=None, seed=None, chunk_games=50, size=100, num_turns=5, quarantine_distance=5, rejection_sampling=False):
+    """Round robin where every ordered pair plays num_games with each agent in each seat.
+
+    agents is a list of (name, dataset, model name) triples. Every dataset
+    gets a game store and a prebuilt KNN model once, up front, which the
+    workers then memory-map. Games are split into chunks of chunk_games and
+    spread over a process pool. Returns the (n, n) matrices of wins (row
+    beat column) and ties.
+    """
+    n = len(agents)
+    workers = workers or os.cpu_count()
+    kwargs = dict(size=size, num_turns=num_turns, quarantine_distance=quarantine_distance, rejection_sampling=rejection_sampling)
+    tasks = []
+    for red in range(n):
+        for blue in range(n):
+            if red == blue:
+                continue
+            for start in range(0, num_games, chunk_games):
+                tasks.append((red, blue, min(chunk_games, num_games - start)))
+    seeds = worker_seeds(seed, len(tasks))
+    shared = {dataset: share_dataset(dataset, num_turns) for _, dataset, _ in agents}
+
+    wins = np.zeros((n, n), dtype=np.int64)
+    ties = np.zeros((n, n), dtype=np.int64)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(agents, shared)) as pool:
+        futures = {pool.submit(_play_pairing, red, blue, games, seeds[k], kwargs): (red, blue, games) for k, (red, blue, games) in enumerate(tasks)}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Chunks played"):
+            red, blue, games = futures[future]
+            red_wins, blue_wins = future.result()
+            wins[red, blue] += red_wins
+            wins[blue, red] += blue_wins
+            tie_count = games - red_wins - blue_wins
+            ties[red, blue] += tie_count
+            ties[blue, red] += tie_count
+    return wins, ties
+
+def print_table(names, wins, ties, ratings):
+    width = max(len(name) for name in names) + 2
+    games = wins + wins.T + ties
+    print("Win % (row vs column, ties in brackets)")
+    print(" " * width + "".join(name.rjust(width + 6) for name in names) + "Elo".rjust(8))
+    for i, name in enumerate(names):
+        cells = []
+        for j in range(len(names)):
+            if i == j or games[i, j] == 0:
+                cells.append("-".rjust(width + 6))
+            else:
+                cells.append(f"{100 * wins[i, j] / games[i, j]:.1f} ({100 * ties[i, j] / games[i, j]:.0f})".rjust(width + 6))
+        print(name.ljust(width) + "".join(cells) + f"{ratings[i]:8.0f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Round-robin tournament between dataset/model agents.")
+    parser.add_argument("agents", nargs="+", help='agent specs "[name=]dataset[:module.function]", model defaults to voronoi_knn.model')
+    parser.add_argument("--games", type=int, default=100, help="games per ordered pairing, so each pair plays twice this")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-games", type=int, default=50)
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--quarantine", type=float, default=5)
+    parser.add_argument("--output", help="write names, win and tie matrices and ratings as JSON")
+    args = parser.parse_args(argv)
+
+    agents = [parse_agent(spec) for spec in args.agents]
+    names = [name for name, _, _ in agents]
+    wins, ties = run_tournament(agents, args.games, args.workers, args.seed, args.chunk_games, args.size, args.turns, args.quarantine)
+    ratings = elo_ratings(bradley_terry(wins, ties))
+    print_table(names, wins, ties, ratings)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                "agents": [{"name": name, "dataset": dataset, "model": model_name} for name, dataset, model_name in agents],
+                "games_per_seat": args.games,
+                "wins": wins.tolist(),
+                "ties": ties.tolist(),
+                "elo": [float(r) for r in ratings],
+            }, file, indent=2)
+
+if __name__ == "__main__":
+    main()
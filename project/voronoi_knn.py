@@ -1,6 +1,15 @@
 from sklearn.neighbors import NearestNeighbors
 import pandas as pd
 import numpy as np
+import os
+import threading
+import weakref
+import time
+import joblib
+from gamestore import normalize_games, load_store, ensure_store
+from symmetry import canonicalize, transform_cells, INVERSE
+from datagen import state_gain_map
+from profiling import profiler
 
 def column_selector(t, column_headers):
     features = column_headers[:t]
@@ -8,50 +17,465 @@ def column_selector(t, column_headers):
     area = column_headers[-1] if t%2==1 else column_headers[-2]
     return features, label, area
 
-def model(current_state:list, data, red_points):
-    t = len(current_state)
-    if t == 0:
-        y = data["Area_P1"] # outcome of the t+1-th player
-        next_move_set = data["Move_1_P1"] # next move set
-
-        indices = np.random.randint(0, data.shape[0], size=20)
-    
-    else: 
-        column_headers = data.columns
-
-        # Filtering data
-        features, label, area = column_selector(t, column_headers)
-        X = data[features] # features: first t columns
-        y = data[str(area)] # outcome of the t+1-th player
-        next_move_set = data[str(label)] # next move set
-
-        # Initialize NearestNeighbors
-        nn = NearestNeighbors(n_neighbors=20)
-        nn.fit(X)
-
-        # Ensure current_state is a DataFrame with correct feature names
-        current_state_df = pd.DataFrame([current_state], columns=features)
-
-        #  Find k nearest neighbors
-        distances, indices = nn.kneighbors(current_state_df)
-        indices = indices.flatten()
-
-    #  Analyze the historical success of t+1-th move in these neighbors
-    move_scores = {}
-    size = 100
-    for index in indices:
-        move = next_move_set.iloc[index]
-        area_control = y.iloc[index]
-
-        a, b = divmod(move, size)
-        if red_points[a][b] == True:
-            area_control -= 10
-
-        if move in move_scores:
-            move_scores[move].append(area_control)
+def row_keys(rows):
+    """View each row of non-negative ints as one opaque key that sorts lexicographically."""
+    rows = np.ascontiguousarray(rows, dtype='>i4')
+    return rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+
+class PrefixTable:
+    """Exact next-move statistics for every distinct move prefix of one ply.
+
+    Rows are grouped by (prefix, next move) into sorted arrays, so a lookup
+    is a binary search over prefix keys followed by a slice of the moves seen
+    after that prefix with their count and mean outcome.
+    """
+    def __init__(self, prefixes, next_moves, outcomes, weights=None):
+        pairs = row_keys(np.column_stack([prefixes, next_moves]))
+        groups, first, inverse = np.unique(pairs, return_index=True, return_inverse=True)
+        if weights is None:
+            self.counts = np.bincount(inverse)
+            self.means = np.bincount(inverse, weights=outcomes) / self.counts
         else:
-            move_scores[move] = [area_control]
-    
-    best_move = max(move_scores, key=lambda x: np.mean(move_scores[x]))  # select move with highest average outcome
+            self.counts = np.bincount(inverse, weights=weights).astype(np.int64)
+            self.means = np.bincount(inverse, weights=outcomes * weights) / self.counts
+        self.moves = next_moves[first]
+        self.keys, self.starts = np.unique(row_keys(prefixes[first]), return_index=True)
+        self.starts = np.append(self.starts, len(groups))
+
+    def lookup(self, current_state):
+        """Return (moves, counts, means) seen after current_state, or None if unseen."""
+        key = row_keys([current_state])[0]
+        pos = np.searchsorted(self.keys, key)
+        if pos == len(self.keys) or self.keys[pos] != key:
+            return None
+        start, stop = self.starts[pos], self.starts[pos + 1]
+        return self.moves[start:stop], self.counts[start:stop], self.means[start:stop]
+
+# Bumped whenever the saved layout of a KNNModel changes, so old snapshots are rebuilt
+MODEL_VERSION = 1
+# Everything a KNNModel needs to answer queries, as saved by KNNModel.save
+SHARED_STATE = ("n_neighbors", "use_prefix_table", "canonical", "size", "candidate_fraction", "quarantine_distance",
+                "columns", "num_rows", "moves", "areas", "weights", "plies", "indexes", "prefix_tables")
+
+class KNNModel:
+    """Nearest-neighbour move model over one dataset.
+
+    One NearestNeighbors index is fitted per ply depth the first time that
+    depth is queried and kept for the lifetime of the model, so a game only
+    pays for fitting once per ply instead of once per move. States that occur
+    verbatim in the dataset are answered from a PrefixTable instead and only
+    unseen states fall back to the neighbour search.
+
+    A compacted dataset (see gamestore.compact_dataset) is used as is: each
+    record counts Count times, so the model recommends the same moves as it
+    would on the expanded games.
+
+    With canonical=True every ply is indexed in canonical board orientation
+    (see symmetry.canonicalize), so the 8 rotations and reflections of a
+    position share one entry. The canonical rows of every ply are built up
+    front and the raw games are then dropped, apart from the first moves
+    that ply 0 samples from. Queries are canonicalized the same way and the
+    chosen move is mapped back to the board the game is actually played on.
+
+    With candidate_fraction set, recommended moves are first checked against
+    the one-ply gain map (see datagen.gain_map): moves that are illegal or
+    gain less than candidate_fraction of the best available gain are dropped,
+    and if none is left the move with the best gain is played.
+
+    The lazy builds and the lookup counters are guarded by a lock, so a model
+    can be shared by threads, e.g. an abandoned aimove.MoveRequest still
+    running while the next move is asked for.
+    """
+    def __init__(self, data, n_neighbors=20, size=100, use_prefix_table=True, canonical=False, candidate_fraction=None, quarantine_distance=5):
+        self.n_neighbors = n_neighbors
+        self.candidate_fraction = candidate_fraction
+        self.quarantine_distance = quarantine_distance
+        self.use_prefix_table = use_prefix_table
+        self.canonical = canonical
+        self.size = size
+        games = normalize_games(data)
+        self.columns = [column for column in games.columns if column.startswith("Move_")] + ['Area_P1', 'Area_P2']
+        self.num_rows = games.shape[0]
+        self.moves = games[self.columns[:-2]].to_numpy()
+        self.areas = {column: games[column].to_numpy() for column in self.columns[-2:]}
+        self.weights = games["Count"].to_numpy() if "Count" in games.columns else None
+        self.plies = {}
+        self.indexes = {}
+        self.prefix_tables = {}
+        self.prefix_hits = 0
+        self.prefix_misses = 0
+        self.prefix_lookup_time = 0.0
+        self.lock = threading.RLock()
+        if canonical:
+            # The merged canonical rows replace the raw games, of which ply 0
+            # only needs the first move and its outcome
+            for t in range(1, len(self.columns) - 2):
+                self.ply_data(t)
+            self.moves = self.moves[:, :1].copy()
+            self.areas = {'Area_P1': self.areas['Area_P1']}
+
+    def ply_data(self, t):
+        """Return (prefixes, next moves, outcomes, weights) used to answer ply t.
+
+        Plain models use the dataset columns directly. Canonical models map
+        every row to its canonical orientation and merge rows that become
+        identical, so their weights are always set.
+        """
+        with self.lock:
+            if t in self.plies:
+                return self.plies[t]
+            features, label, area = column_selector(t, self.columns)
+            prefixes, next_moves, outcomes, weights = self.moves[:, :t], self.moves[:, t], self.areas[area], self.weights
+            if self.canonical:
+                prefixes, k = canonicalize(prefixes, self.size)
+                next_moves = transform_cells(next_moves, k, self.size)
+                weights = np.ones(len(prefixes), dtype=np.int64) if weights is None else weights
+                pairs = row_keys(np.column_stack([prefixes, next_moves]))
+                groups, first, inverse = np.unique(pairs, return_index=True, return_inverse=True)
+                merged = np.bincount(inverse, weights=weights)
+                outcomes = np.bincount(inverse, weights=outcomes * weights) / merged
+                prefixes, next_moves, weights = prefixes[first], next_moves[first], merged.astype(np.int64)
+            self.plies[t] = (prefixes, next_moves, outcomes, weights)
+        return self.plies[t]
+
+    def orient(self, states):
+        """Map states to the frame the indexes use and return the transforms applied."""
+        if not self.canonical:
+            return states, np.zeros(len(states), dtype=np.int64)
+        return canonicalize(states, self.size)
+
+    def restore(self, moves, k):
+        """Map moves from the index frame back onto the real board."""
+        if not self.canonical:
+            return moves
+        return transform_cells(moves, INVERSE[k], self.size)
+
+    def build(self, plies):
+        """Build the ply data, prefix table and index of every ply in plies up front."""
+        for t in plies:
+            self.ply_data(t)
+            if t > 0:
+                if self.use_prefix_table:
+                    self.prefix_table(t)
+                self.index(t)
+
+    def save(self, path, plies=None):
+        """Dump the model and everything built so far to path, building plies first if given.
+
+        joblib stores each array as its own block, so KNNModel.load can
+        memory-map them read-only and every process loading the same file
+        shares one copy through the page cache.
+        """
+        if plies is not None:
+            self.build(plies)
+        state = {name: getattr(self, name) for name in SHARED_STATE}
+        state["version"] = MODEL_VERSION
+        joblib.dump(state, path)
+        return path
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a model written by save, with its arrays memory-mapped read-only by default."""
+        model = cls.__new__(cls)
+        model.__dict__.update(joblib.load(path, mmap_mode='r' if mmap else None))
+        model.__dict__.pop("version", None)
+        model.prefix_hits = 0
+        model.prefix_misses = 0
+        model.prefix_lookup_time = 0.0
+        model.lock = threading.RLock()
+        return model
+
+    def prefix_table(self, t):
+        """Return the prefix table of ply t, building it on first use."""
+        with self.lock:
+            if t not in self.prefix_tables:
+                with profiler.phase("prefix_build"):
+                    self.prefix_tables[t] = PrefixTable(*self.ply_data(t))
+            return self.prefix_tables[t]
+
+    def lookup(self, current_state):
+        """Exact prefix lookup that records hit rate and latency."""
+        table = self.prefix_table(len(current_state))
+        tic = time.perf_counter()
+        found = table.lookup(current_state)
+        with self.lock:
+            self.prefix_lookup_time += time.perf_counter() - tic
+            if found is None:
+                self.prefix_misses += 1
+            else:
+                self.prefix_hits += 1
+        profiler.count("prefix_misses" if found is None else "prefix_hits")
+        return found
+
+    def prefix_stats(self):
+        """Hit rate and mean latency of the exact prefix lookups made so far."""
+        lookups = self.prefix_hits + self.prefix_misses
+        return {
+            "lookups": lookups,
+            "hits": self.prefix_hits,
+            "hit_rate": self.prefix_hits / lookups if lookups else 0.0,
+            "mean_lookup_us": 1e6 * self.prefix_lookup_time / lookups if lookups else 0.0,
+        }
+
+    def index(self, t):
+        """Return the index fitted on the first t moves, fitting it on first use."""
+        with self.lock:
+            if t not in self.indexes:
+                prefixes = self.ply_data(t)[0]
+                nn = NearestNeighbors(n_neighbors=min(self.n_neighbors, len(prefixes)))
+                with profiler.phase("index_fit"):
+                    nn.fit(prefixes)
+                self.indexes[t] = nn
+            return self.indexes[t]
+
+    def neighbors(self, states):
+        """Return next moves, outcomes and weights of the rows nearest to each state.
+
+        Weights say how many of the n_neighbors games each row stands for: one
+        per row on a plain dataset, and on a compacted one the record counts,
+        cut off once n_neighbors games have been taken in distance order.
+        """
+        num_games, t = states.shape
+        if t == 0:
+            if self.weights is None:
+                indices = np.random.randint(0, self.num_rows, size=(num_games, self.n_neighbors))
+            else:
+                indices = np.random.choice(self.num_rows, size=(num_games, self.n_neighbors), p=self.weights / self.weights.sum())
+            return self.moves[indices, 0], self.areas["Area_P1"][indices], np.ones(indices.shape, dtype=np.int64)
+
+        prefixes, next_moves, outcomes, weights = self.ply_data(t)
+        distances, indices = self.index(t).kneighbors(states)
+        if weights is None:
+            weights = np.ones(indices.shape, dtype=np.int64)
+        else:
+            weights = weights[indices]
+            taken = np.cumsum(weights, axis=1) - weights
+            weights = np.clip(self.n_neighbors - taken, 0, weights)
+        return next_moves[indices], outcomes[indices], weights
+
+    def candidate_gains(self, states):
+        """Flattened gain maps, one row per state, or None without a candidate filter."""
+        if self.candidate_fraction is None:
+            return None
+        return np.stack([state_gain_map(state, self.size, self.quarantine_distance).ravel() for state in states])
+
+    def keep_candidates(self, gains, owner, moves):
+        """Mask of moves that are legal and gain at least candidate_fraction of their game's best."""
+        best = gains.max(axis=1)
+        threshold = np.where(best > 0, self.candidate_fraction * best, best)
+        values = gains[owner, moves]
+        return np.isfinite(values) & (values >= threshold[owner])
+
+    def predict(self, current_state, red_points=None):
+        """Pick the next move with the highest average outcome.
+
+        Exact prefix matches use every game that shares the state; otherwise
+        the nearest neighbours' next moves are scored.
+        """
+        t = len(current_state)
+        raw_states = np.asarray([current_state], dtype=np.int64).reshape(1, -1)
+        states, k = self.orient(raw_states)
+        gains = self.candidate_gains(raw_states)
+        if self.use_prefix_table and t > 0:
+            found = self.lookup(states[0])
+            if found is not None:
+                moves, counts, means = found
+                moves = self.restore(moves, k[0])
+                if red_points is not None:
+                    a, b = np.divmod(moves, self.size)
+                    means = means - 10 * (np.asarray(red_points)[a, b] == True)
+                if gains is not None:
+                    keep = self.keep_candidates(gains, np.zeros(len(moves), dtype=np.int64), moves)
+                    if not keep.any():
+                        return gains[0].argmax()
+                    moves, means = moves[keep], means[keep]
+                return moves[np.argmax(means)]
+
+        next_moves, outcomes, weights = self.neighbors(states)
+        next_moves = self.restore(next_moves, k[:, np.newaxis])
+        keep = None if gains is None else self.keep_candidates(gains, np.zeros(next_moves.shape[1], dtype=np.int64), next_moves[0])
+
+        #  Analyze the historical success of t+1-th move in these neighbors
+        move_scores = {}
+        move_weights = {}
+        for j, (move, area_control, weight) in enumerate(zip(next_moves[0], outcomes[0], weights[0])):
+            if weight == 0 or (keep is not None and not keep[j]):
+                continue
+            a, b = divmod(move, self.size)
+            if red_points is not None and red_points[a][b] == True:
+                area_control -= 10
+
+            if move in move_scores:
+                move_scores[move].append(area_control)
+                move_weights[move].append(weight)
+            else:
+                move_scores[move] = [area_control]
+                move_weights[move] = [weight]
+
+        if not move_scores:
+            return gains[0].argmax()
+        if (self.weights if t == 0 else self.ply_data(t)[3]) is None:
+            best_move = max(move_scores, key=lambda x: np.mean(move_scores[x]))  # select move with highest average outcome
+        else:
+            best_move = max(move_scores, key=lambda x: np.average(move_scores[x], weights=move_weights[x]))
+
+        return best_move
+
+    def lookup_batch(self, states):
+        """Vectorized exact prefix lookup for many states of the same ply.
+
+        Returns a hit mask plus, for the hit states, the flattened candidate
+        slices: the owning state of every candidate, its move and mean outcome.
+        """
+        table = self.prefix_table(states.shape[1])
+        tic = time.perf_counter()
+        keys = row_keys(states)
+        pos = np.minimum(np.searchsorted(table.keys, keys), len(table.keys) - 1)
+        hit = table.keys[pos] == keys
+        starts, stops = table.starts[pos[hit]], table.starts[pos[hit] + 1]
+        lengths = stops - starts
+        owner = np.repeat(np.flatnonzero(hit), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        candidates = np.repeat(starts, lengths) + offsets
+        with self.lock:
+            self.prefix_lookup_time += time.perf_counter() - tic
+            self.prefix_hits += int(hit.sum())
+            self.prefix_misses += int((~hit).sum())
+        return hit, owner, table.moves[candidates], table.means[candidates]
+
+    def predict_batch(self, states, red_points=None):
+        """Pick next moves for many games at the same ply in one pass.
+
+        states is a (G, t) array of move prefixes and red_points, if given, a
+        (G, size, size) stack of each game's red territory. Exact prefix hits
+        are answered from the prefix table and all misses share a single
+        kneighbors query; moves are scored the same way as predict.
+        """
+        states = np.asarray(states, dtype=np.int64).reshape(len(states), -1)
+        gains = self.candidate_gains(states)
+        states, k = self.orient(states)
+        num_games, t = states.shape
+        best = np.empty(num_games, dtype=self.moves.dtype)
+        miss = np.ones(num_games, dtype=bool)
+
+        if self.use_prefix_table and t > 0:
+            hit, owner, moves, means = self.lookup_batch(states)
+            moves = self.restore(moves, k[owner])
+            if red_points is not None:
+                a, b = np.divmod(moves, self.size)
+                means = means - 10 * (np.asarray(red_points)[owner, a, b] == True)
+            if gains is not None:
+                means = np.where(self.keep_candidates(gains, owner, moves), means, -np.inf)
+            # Highest mean per game, first candidate on ties
+            order = np.lexsort((np.arange(len(owner)), -means, owner))
+            owner, moves = owner[order], moves[order]
+            first = np.ones(len(owner), dtype=bool)
+            first[1:] = owner[1:] != owner[:-1]
+            best[owner[first]] = moves[first]
+            if gains is not None:
+                filtered = owner[first][means[order][first] == -np.inf]
+                best[filtered] = gains[filtered].argmax(axis=1)
+            miss = ~hit
+
+        games = np.flatnonzero(miss)
+        if len(games) > 0:
+            next_moves, outcomes, weights = self.neighbors(states[games])
+            next_moves = self.restore(next_moves, k[games, np.newaxis])
+            if red_points is not None:
+                a, b = np.divmod(next_moves, self.size)
+                outcomes = outcomes - 10 * (np.asarray(red_points)[games[:, np.newaxis], a, b] == True)
+            same = (next_moves[:, :, np.newaxis] == next_moves[:, np.newaxis, :]) * weights[:, np.newaxis, :]
+            means = (same * outcomes[:, np.newaxis, :]).sum(axis=2) / same.sum(axis=2)
+            means[weights == 0] = -np.inf
+            if gains is not None:
+                owner = np.broadcast_to(games[:, np.newaxis], next_moves.shape)
+                means[~self.keep_candidates(gains, owner, next_moves)] = -np.inf
+            best[games] = next_moves[np.arange(len(games)), means.argmax(axis=1)]
+            if gains is not None:
+                filtered = games[means.max(axis=1) == -np.inf]
+                best[filtered] = gains[filtered].argmax(axis=1)
+        return best
+
+_models = {}
+
+def get_model(data, **options):
+    """Return the cached KNNModel for this dataset, building it on first use.
+
+    Models are keyed by the identity of the DataFrame plus any KNNModel
+    options and dropped once the DataFrame is garbage collected, so reloading
+    a dataset gets a fresh model.
+    """
+    key = (id(data), tuple(sorted(options.items())))
+    if key not in _models:
+        _models[key] = KNNModel(data, **options)
+        weakref.finalize(data, _models.pop, key, None)
+    return _models[key]
+
+def index_path_for(store_path, **options):
+    """Where share_model keeps the prebuilt model of a game store for these options."""
+    suffix = "".join("-{}={}".format(name, value) for name, value in sorted(options.items()))
+    return os.path.join(store_path, "knn{}.joblib".format(suffix))
+
+def share_model(store_path, plies, **options):
+    """Prebuild the model of a game store for plies and save it next to the store.
+
+    The file is rebuilt only when it is missing, older than the store or
+    saved by another MODEL_VERSION, and its path is returned for
+    attach_model in worker processes.
+    """
+    index_path = index_path_for(store_path, **options)
+    manifest_path = os.path.join(store_path, "manifest.json")
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(manifest_path) or saved_version(index_path) != MODEL_VERSION:
+        KNNModel(load_store(store_path), **options).save(index_path, plies)
+    return index_path
+
+def saved_version(index_path):
+    """MODEL_VERSION a saved model was written with, or None if it cannot be read."""
+    try:
+        return joblib.load(index_path, mmap_mode='r').get("version")
+    except Exception:
+        return None
+
+def attach_model(data, index_path, **options):
+    """Serve get_model(data, **options) from a saved model instead of building one."""
+    loaded = KNNModel.load(index_path)
+    if loaded.num_rows != len(data):
+        raise ValueError("{} was built from {} games, the dataset has {}".format(index_path, loaded.num_rows, len(data)))
+    key = (id(data), tuple(sorted(options.items())))
+    _models[key] = loaded
+    weakref.finalize(data, _models.pop, key, None)
+    return loaded
+
+def load_snapshot(path, num_turns=5, **options):
+    """Load a dataset with its KNN model ready, from the snapshot kept next to it.
+
+    The snapshot is the dataset's game store plus the model saved by
+    share_model. Each part is rebuilt only when its source changed or its
+    version is out of date, so after the first run this only memory-maps
+    files and model(state, data) answers without building anything.
+    """
+    store_path = ensure_store(path)
+    index_path = share_model(store_path, range(2 * num_turns), **options)
+    data = load_store(store_path)
+    attach_model(data, index_path, **options)
+    return data
+
+def model(current_state:list, data, red_points=None):
+    return get_model(data).predict(current_state, red_points)
+
+def model_batch(states, data, red_points=None):
+    return get_model(data).predict_batch(states, red_points)
+
+def canonical_model(current_state:list, data, red_points=None):
+    """model() answering from symmetry-canonicalized indexes."""
+    return get_model(data, canonical=True).predict(current_state, red_points)
+
+def canonical_model_batch(states, data, red_points=None):
+    return get_model(data, canonical=True).predict_batch(states, red_points)
+
+def filtered_model(current_state:list, data, red_points=None):
+    """model() restricted to moves within half of the best one-ply gain."""
+    return get_model(data, candidate_fraction=0.5).predict(current_state, red_points)
 
-    return best_move
\ No newline at end of file
+def filtered_model_batch(states, data, red_points=None):
+    return get_model(data, candidate_fraction=0.5).predict_batch(states, red_points)